@@ -10,17 +10,33 @@ export class NotificationService {
     push: 'push.queue',
   };
 
+  // transactional email (OTP, password reset) goes to its own lane in email-service
+  private readonly transactionalPriorities = ['high', 'transactional'];
+
+  private routingKeyFor(payload: any): string {
+    const priority = String(payload.metadata?.priority ?? '').toLowerCase();
+    if (
+      payload.notification_type === 'email' &&
+      this.transactionalPriorities.includes(priority)
+    ) {
+      return 'email.transactional';
+    }
+    return payload.notification_type;
+  }
+
   async routeNotification(payload: any) {
     const connection = await amqp.connect(process.env.RABBITMQ_URL);
     const channel = await connection.createChannel();
 
     await channel.assertExchange(this.exchange, 'direct', { durable: true });
-    const routingKey = payload.notification_type;
+    const routingKey = this.routingKeyFor(payload);
 
     await channel.publish(
       this.exchange,
       routingKey,
       Buffer.from(JSON.stringify(payload)),
+      // AMQP timestamps are whole seconds; email-service measures queue wait from it
+      { timestamp: Math.floor(Date.now() / 1000) },
     );
 
     await channel.close();
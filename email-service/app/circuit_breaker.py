@@ -1,45 +1,176 @@
+import contextlib
+import os
+import threading
 import time
-from typing import Callable
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+from app.metrics import record_circuit_state
+
+# defaults for every named breaker; a downstream can override with CB_<NAME>_<SETTING>
+CB_WINDOW_SECONDS = float(os.getenv("CB_WINDOW_SECONDS", "30"))
+CB_MINIMUM_CALLS = int(os.getenv("CB_MINIMUM_CALLS", "10"))
+CB_FAILURE_RATE = float(os.getenv("CB_FAILURE_RATE", "0.5"))
+CB_SLOW_CALL_RATE = float(os.getenv("CB_SLOW_CALL_RATE", "0.8"))
+CB_SLOW_CALL_SECONDS = float(os.getenv("CB_SLOW_CALL_SECONDS", "10"))
+CB_RESET_TIMEOUT = float(os.getenv("CB_RESET_TIMEOUT", "30"))
+CB_HALF_OPEN_MAX_CALLS = int(os.getenv("CB_HALF_OPEN_MAX_CALLS", "3"))
 
 class CircuitOpen(Exception):
     pass
 
 class CircuitBreaker:
-    def __init__(self, fail_threshold=5, reset_timeout=30):
-        self.fail_threshold = fail_threshold
+    """
+    Rolling-window breaker. Trips OPEN when, over the last `window_seconds` and at
+    least `minimum_calls` calls, the failure rate or the slow-call rate reaches its
+    threshold. After `reset_timeout` it goes HALF open and admits at most
+    `half_open_max_calls` probes; that many successes close it, any failed or
+    slow probe re-opens it. State is guarded by a lock so the breaker can be
+    shared by every coroutine (or thread) talking to the same downstream.
+    """
+
+    def __init__(self, name: str = "default", failure_rate_threshold: float = CB_FAILURE_RATE,
+                 slow_call_rate_threshold: float = CB_SLOW_CALL_RATE, slow_call_duration: float = CB_SLOW_CALL_SECONDS,
+                 window_seconds: float = CB_WINDOW_SECONDS, minimum_calls: int = CB_MINIMUM_CALLS,
+                 reset_timeout: float = CB_RESET_TIMEOUT, half_open_max_calls: int = CB_HALF_OPEN_MAX_CALLS,
+                 on_state_change: Optional[Callable[[str, str], None]] = None,
+                 is_failure: Optional[Callable[[BaseException], bool]] = None):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.slow_call_duration = slow_call_duration
+        self.window_seconds = window_seconds
+        self.minimum_calls = minimum_calls
         self.reset_timeout = reset_timeout
-        self._failure_count = 0
-        self._last_failure_time = None
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self.on_state_change = on_state_change
+        self.is_failure = is_failure or (lambda exc: True)
+        self._lock = threading.Lock()
         self._state = "CLOSED"  # CLOSED, OPEN, HALF
+        self._generation = 0
+        self._opened_at = 0.0
+        # one [second, calls, failures, slow] bucket per second of the window
+        self._buckets: deque = deque()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    @property
+    def state(self) -> str:
+        return self._state
 
-    def record_success(self):
-        self._failure_count = 0
-        self._state = "CLOSED"
+    def _set_state(self, state: str):
+        # caller holds the lock
+        if state == self._state:
+            return
+        self._state = state
+        self._generation += 1
+        self._buckets.clear()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        if state == "OPEN":
+            self._opened_at = time.monotonic()
+        if self.on_state_change:
+            self.on_state_change(self.name, state)
 
-    def record_failure(self):
-        self._failure_count += 1
-        self._last_failure_time = time.time()
-        if self._failure_count >= self.fail_threshold:
-            self._state = "OPEN"
+    def _acquire(self) -> Optional[Tuple[int, bool]]:
+        """Admit a call; returns a permit (generation, is_probe) or None if rejected."""
+        with self._lock:
+            if self._state == "OPEN":
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return None
+                self._set_state("HALF")
+            if self._state == "HALF":
+                if self._probes_in_flight >= self.half_open_max_calls:
+                    return None
+                self._probes_in_flight += 1
+                return self._generation, True
+            return self._generation, False
+
+    def _record(self, permit: Tuple[int, bool], duration: float, failed: bool):
+        generation, is_probe = permit
+        slow = duration >= self.slow_call_duration
+        with self._lock:
+            if generation != self._generation:
+                # admitted under a previous state; its outcome no longer applies
+                return
+            if is_probe:
+                self._probes_in_flight -= 1
+                if failed or slow:
+                    self._set_state("OPEN")
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_max_calls:
+                        self._set_state("CLOSED")
+                return
+            now = int(time.monotonic())
+            if self._buckets and self._buckets[-1][0] == now:
+                bucket = self._buckets[-1]
+            else:
+                bucket = [now, 0, 0, 0]
+                self._buckets.append(bucket)
+            bucket[1] += 1
+            bucket[2] += failed
+            bucket[3] += slow
+            while self._buckets and self._buckets[0][0] <= now - self.window_seconds:
+                self._buckets.popleft()
+            calls = sum(b[1] for b in self._buckets)
+            if calls < self.minimum_calls:
+                return
+            failure_rate = sum(b[2] for b in self._buckets) / calls
+            slow_rate = sum(b[3] for b in self._buckets) / calls
+            if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+                self._set_state("OPEN")
 
     def allow_request(self) -> bool:
-        if self._state == "OPEN":
-            elapsed = time.time() - (self._last_failure_time or 0)
-            if elapsed > self.reset_timeout:
-                self._state = "HALF"
-                return True
-            return False
-        return True
+        # kept for callers that only want to peek; does not take a half-open probe slot
+        with self._lock:
+            if self._state == "OPEN":
+                return time.monotonic() - self._opened_at >= self.reset_timeout
+            if self._state == "HALF":
+                return self._probes_in_flight < self.half_open_max_calls
+            return True
+
+    @contextlib.asynccontextmanager
+    async def guard(self):
+        permit = self._acquire()
+        if permit is None:
+            raise CircuitOpen(f"Circuit {self.name} is open")
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as exc:
+            failed = isinstance(exc, Exception) and self.is_failure(exc)
+            self._record(permit, time.monotonic() - started, failed)
+            raise
+        else:
+            self._record(permit, time.monotonic() - started, False)
 
     def __call__(self, fn: Callable):
         async def wrapper(*args, **kwargs):
-            if not self.allow_request():
-                raise CircuitOpen("Circuit is open")
-            try:
-                result = await fn(*args, **kwargs)
-                self.record_success()
-                return result
-            except Exception as e:
-                self.record_failure()
-                raise
+            async with self.guard():
+                return await fn(*args, **kwargs)
         return wrapper
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def _setting(name: str, key: str, default):
+    value = os.getenv(f"CB_{name.upper()}_{key}")
+    return type(default)(value) if value is not None else default
+
+def get_breaker(name: str, **overrides) -> CircuitBreaker:
+    """Return the process-wide breaker for a downstream (smtp, template_service, redis, ...)."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        settings = {
+            "failure_rate_threshold": _setting(name, "FAILURE_RATE", CB_FAILURE_RATE),
+            "slow_call_rate_threshold": _setting(name, "SLOW_CALL_RATE", CB_SLOW_CALL_RATE),
+            "slow_call_duration": _setting(name, "SLOW_CALL_SECONDS", CB_SLOW_CALL_SECONDS),
+            "window_seconds": _setting(name, "WINDOW_SECONDS", CB_WINDOW_SECONDS),
+            "minimum_calls": _setting(name, "MINIMUM_CALLS", CB_MINIMUM_CALLS),
+            "reset_timeout": _setting(name, "RESET_TIMEOUT", CB_RESET_TIMEOUT),
+            "half_open_max_calls": _setting(name, "HALF_OPEN_MAX_CALLS", CB_HALF_OPEN_MAX_CALLS),
+            "on_state_change": record_circuit_state,
+        }
+        settings.update(overrides)
+        breaker = _breakers[name] = CircuitBreaker(name, **settings)
+    return breaker
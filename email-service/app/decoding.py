@@ -0,0 +1,78 @@
+# app/decoding.py
+import json
+import os
+from typing import Any, Dict, Optional
+from app.schemas import EmailMessagePayload
+
+try:
+    import msgspec
+except ImportError:  # optional: fast path only
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # optional: fast path only
+    orjson = None
+
+# auto picks the fastest installed: msgspec, then orjson, then json + pydantic
+PAYLOAD_DECODER = os.getenv("PAYLOAD_DECODER", "auto").lower()
+
+
+if msgspec is not None:
+    class EmailPayload(msgspec.Struct, frozen=True):
+        """Same fields and types as EmailMessagePayload, decoded and validated in one pass from the raw bytes."""
+        request_id: str
+        to: str
+        subject: Optional[str] = None
+        body: Optional[str] = None
+        template_name: Optional[str] = None
+        variables: Optional[Dict[str, str]] = {}
+        metadata: Optional[Dict[str, str]] = {}
+
+    _msgspec_decoder = msgspec.json.Decoder(EmailPayload)
+
+
+def _decode_msgspec(body: bytes):
+    try:
+        return _msgspec_decoder.decode(body)
+    except msgspec.ValidationError:
+        # msgspec never coerces; pydantic turns numbers into strings (e.g. "to": 5, {"code": 1234}),
+        # so let it decide rather than reject what the other decoders accept
+        return _decode_json(body)
+
+
+def _decode_orjson(body: bytes) -> EmailMessagePayload:
+    # orjson parses the bytes directly; pydantic still validates
+    return EmailMessagePayload.parse_obj(orjson.loads(body))
+
+
+def _decode_json(body: bytes) -> EmailMessagePayload:
+    return EmailMessagePayload.parse_obj(json.loads(body))
+
+
+def _pick_decoder():
+    decoders = {"json": _decode_json, "pydantic": _decode_json}
+    if orjson is not None:
+        decoders["orjson"] = _decode_orjson
+    if msgspec is not None:
+        decoders["msgspec"] = _decode_msgspec
+    if PAYLOAD_DECODER != "auto":
+        if PAYLOAD_DECODER in decoders:
+            return PAYLOAD_DECODER, decoders[PAYLOAD_DECODER]
+        print(f"PAYLOAD_DECODER={PAYLOAD_DECODER} is not available; picking automatically")
+    for name in ("msgspec", "orjson", "json"):
+        if name in decoders:
+            return name, decoders[name]
+
+
+DECODER_NAME, _decode = _pick_decoder()
+
+
+def decode_payload(body: bytes) -> Any:
+    """
+    Decode and validate a queue message body into a typed payload with attribute
+    access (request_id, to, subject, body, template_name, variables, metadata).
+    Raises ValueError subclasses on malformed JSON or a payload that fails validation.
+    """
+    return _decode(body)
+
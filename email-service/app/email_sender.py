@@ -2,7 +2,13 @@ import os
 from email.message import EmailMessage
 import aiosmtplib
 import httpx
-from app.circuit_breaker import CircuitBreaker
+from jinja2.sandbox import SandboxedEnvironment
+from app.circuit_breaker import get_breaker, CircuitOpen
+from app.smtp_pool import SMTPConnectionPool
+from app.smtp_batch import DomainBatcher
+from app.rate_limit import SendShaper
+from app.render_cache import TTLCache, variables_digest
+from app.metrics import RENDER_LATENCY, SMTP_SEND_LATENCY
 
 # --- Environment Configuration ---
 SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
@@ -10,16 +16,78 @@ SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
 SMTP_USERNAME = os.getenv("SMTP_USERNAME", "")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
 SMTP_SENDER = os.getenv("SMTP_SENDER", SMTP_USERNAME or "no-reply@example.com")
+SMTP_START_TLS = os.getenv("SMTP_START_TLS", "true").lower() in ("1", "true", "yes")
 TEMPLATE_SERVICE_URL = os.getenv("TEMPLATE_SERVICE_URL", "http://template-service:8001")
+# remote: POST every render to template-service; local: fetch each template version once and render here
+TEMPLATE_RENDER_MODE = os.getenv("TEMPLATE_RENDER_MODE", "remote")
+TEMPLATE_HTTP_MAX_CONNECTIONS = int(os.getenv("TEMPLATE_HTTP_MAX_CONNECTIONS", "20"))
+RENDER_CACHE_TTL = float(os.getenv("RENDER_CACHE_TTL_SECONDS", "0"))  # 0 disables the rendered-output cache
+RENDER_CACHE_MAX_ENTRIES = int(os.getenv("RENDER_CACHE_MAX_ENTRIES", "10000"))
+TEMPLATE_FETCH_TTL = float(os.getenv("TEMPLATE_FETCH_TTL_SECONDS", "60"))
+# group concurrent sends by recipient domain and send each group on one SMTP session
+SMTP_BATCHING = os.getenv("SMTP_BATCHING", "false").lower() in ("1", "true", "yes")
+
+def _is_template_failure(exc: BaseException) -> bool:
+    # a 4xx (e.g. template_not_found) is the caller's problem, not template-service being down
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return True
+
+
+cb = get_breaker("smtp")
+template_cb = get_breaker("template_service", is_failure=_is_template_failure)
+
+
+def _new_smtp_client() -> aiosmtplib.SMTP:
+    # Gmail requires STARTTLS on port 587; connect() also logs in, so pooled sessions are ready to send
+    return aiosmtplib.SMTP(
+        hostname=SMTP_HOST,
+        port=SMTP_PORT,
+        start_tls=SMTP_START_TLS,
+        username=SMTP_USERNAME or None,
+        password=SMTP_PASSWORD or None,
+        timeout=15.0,
+    )
+
+
+smtp_pool = SMTPConnectionPool(_new_smtp_client)
+smtp_shaper = SendShaper()
+smtp_batcher = DomainBatcher(smtp_pool, smtp_shaper, breaker=cb)
+# same rendering rules as template-service for email: sandboxed, HTML-escaped bodies
+_subject_env = SandboxedEnvironment(autoescape=False)
+_body_env = SandboxedEnvironment(autoescape=True)
+rendered_cache = TTLCache(RENDER_CACHE_TTL, RENDER_CACHE_MAX_ENTRIES)
+fetched_templates = TTLCache(TEMPLATE_FETCH_TTL, RENDER_CACHE_MAX_ENTRIES)
+
+_http_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """One keep-alive client for all template-service calls."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            base_url=TEMPLATE_SERVICE_URL,
+            timeout=15.0,
+            limits=httpx.Limits(
+                max_connections=TEMPLATE_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=TEMPLATE_HTTP_MAX_CONNECTIONS,
+            ),
+        )
+    return _http_client
 
-cb = CircuitBreaker(fail_threshold=5, reset_timeout=30)
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
 
 
 # --- SMTP Send Function ---
-@cb
 async def _send_smtp(to: str, subject: str, body: str):
     """
-    Sends email via Gmail SMTP using aiosmtplib with STARTTLS
+    Sends email via Gmail SMTP using aiosmtplib with STARTTLS, reusing pooled sessions
     """
     if not SMTP_USERNAME or not SMTP_PASSWORD:
         raise ValueError("SMTP credentials are missing. Please set SMTP_USERNAME and SMTP_PASSWORD in environment.")
@@ -30,49 +98,94 @@ async def _send_smtp(to: str, subject: str, body: str):
     message["Subject"] = subject
     message.set_content(body, subtype="html")  # use HTML-capable content
 
-    # Gmail requires STARTTLS on port 587
-    await aiosmtplib.send(
-        message,
-        hostname=SMTP_HOST,
-        port=SMTP_PORT,
-        start_tls=True,
-        username=SMTP_USERNAME,
-        password=SMTP_PASSWORD,
-        timeout=15.0,
-    )
+    # fail fast while the relay is known to be down rather than queue behind the shaper
+    if not cb.allow_request():
+        raise CircuitOpen(f"Circuit {cb.name} is open")
+
+    if SMTP_BATCHING:
+        # shaped and guarded per message inside the batch
+        await smtp_batcher.send(message)
+        return True
+
+    # shape to the relay's limits before the send; only the send itself is timed by the
+    # breaker, so waiting for our own rate limit never counts as a slow call
+    async with smtp_shaper.slot(to):
+        async with cb.guard():
+            with SMTP_SEND_LATENCY.time():
+                await smtp_pool.send_message(message)
 
     return True
 
 
 # --- Template Rendering ---
-async def render_template(template_name: str, variables: dict):
-    """
-    Calls the Template Service render endpoint to build subject/body dynamically.
-    """
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        resp = await client.post(
-            f"{TEMPLATE_SERVICE_URL}/templates/render",
-            json={"template_name": template_name, "variables": variables},
+async def _fetch_compiled_template(template_code: str, language: str):
+    cached = fetched_templates.get((template_code, language))
+    if cached is not None:
+        return cached
+    async with template_cb.guard():
+        resp = await get_http_client().get(
+            "/api/v1/templates/get",
+            params={"template_code": template_code, "language": language},
         )
         resp.raise_for_status()
-        return resp.json()  # Expected {"subject": "...", "body": "..."}
+    version = resp.json()
+    compiled = (
+        _subject_env.from_string(version["subject"]) if version.get("subject") else None,
+        _body_env.from_string(version["body"]),
+    )
+    fetched_templates.put((template_code, language), compiled)
+    return compiled
+
+
+async def render_template(template_name: str, variables: dict, language: str = "en"):
+    """
+    Builds subject/body for a template, either through the Template Service
+    render endpoint or locally from a fetched template version.
+    """
+    key = None
+    if rendered_cache.enabled:
+        key = (template_name, language, variables_digest(variables))
+        cached = rendered_cache.get(key)
+        if cached is not None:
+            return cached
+
+    with RENDER_LATENCY.labels(mode=TEMPLATE_RENDER_MODE).time():
+        if TEMPLATE_RENDER_MODE == "local":
+            subject_t, body_t = await _fetch_compiled_template(template_name, language)
+            rendered = {
+                "subject": subject_t.render(**variables) if subject_t else None,
+                "body": body_t.render(**variables),
+            }
+        else:
+            async with template_cb.guard():
+                resp = await get_http_client().post(
+                    "/api/v1/templates/render",
+                    json={"template_code": template_name, "variables": variables, "language": language},
+                )
+                resp.raise_for_status()
+            rendered = resp.json()  # Expected {"subject": "...", "body": "..."}
+
+    if key is not None:
+        rendered_cache.put(key, rendered)
+    return rendered
 
 
 # --- High-Level Send Entry Point ---
-async def send_email(payload: dict):
+async def send_email(payload):
     """
     Sends email directly or via a rendered template.
 
-    payload must include:
+    payload is a decoded message (see app.decoding) and must include:
       - "to"
       - either ("subject" and "body") or ("template_name" and "variables")
     """
-    if payload.get("subject") and payload.get("body"):
-        subject, body = payload["subject"], payload["body"]
-    elif payload.get("template_name"):
-        rendered = await render_template(payload["template_name"], payload.get("variables") or {})
+    if payload.subject and payload.body:
+        subject, body = payload.subject, payload.body
+    elif payload.template_name:
+        language = (payload.metadata or {}).get("language") or "en"
+        rendered = await render_template(payload.template_name, payload.variables or {}, language)
         subject, body = rendered["subject"], rendered["body"]
     else:
         raise ValueError("Invalid payload. Provide subject/body or template_name + variables.")
 
-    return await _send_smtp(payload["to"], subject, body)
+    return await _send_smtp(payload.to, subject, body)
@@ -1,21 +1,142 @@
 # app/idempotency.py
+import asyncio
 import os
+from typing import List, Optional, Tuple
 import redis.asyncio as redis
+from app.metrics import IDEMPOTENCY_LATENCY
+from app.circuit_breaker import get_breaker
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))  # 1 day default
+# how long a claim protects an in-progress send; should exceed the slowest send
+IDEMPOTENCY_CLAIM_TTL = int(os.getenv("IDEMPOTENCY_CLAIM_TTL", "120"))
+# coalesce claims issued in the same event-loop tick into one pipelined round-trip
+IDEMPOTENCY_BATCH_CLAIMS = os.getenv("IDEMPOTENCY_BATCH_CLAIMS", "false").lower() in ("1", "true", "yes")
+
+redis_cb = get_breaker("redis")
+
+IN_PROGRESS_VALUE = "processing"
+DONE_VALUE = "1"
+
+# claim() outcomes
+CLAIMED = "claimed"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+
+# only drop our own in-progress marker, never a confirmed one
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _claim_outcome(previous: Optional[str]) -> str:
+    if previous is None:
+        return CLAIMED
+    if previous == IN_PROGRESS_VALUE:
+        return IN_PROGRESS
+    return DONE
 
 
 class Idempotency:
-    def __init__(self, redis_client: redis.Redis):
+    """
+    Claim-then-confirm duplicate protection.
+
+    claim() atomically sets the key to "processing" with a short TTL (SET NX GET),
+    so only one consumer can own a request id at a time; confirm() promotes it to
+    done for IDEMPOTENCY_TTL; release() gives the claim up after a failure so a
+    retry can take it.
+    """
+
+    def __init__(self, redis_client: redis.Redis, batch_claims: bool = IDEMPOTENCY_BATCH_CLAIMS):
         self.redis = redis_client
+        self.batch_claims = batch_claims
+        self._release = redis_client.register_script(_RELEASE_SCRIPT)
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
 
     async def is_processed(self, request_id: str) -> bool:
         exists = await self.redis.exists(request_id)
         return exists == 1
 
     async def mark_processed(self, request_id: str):
-        await self.redis.set(request_id, "1", ex=IDEMPOTENCY_TTL)
+        await self.redis.set(request_id, DONE_VALUE, ex=IDEMPOTENCY_TTL)
+
+    async def claim(self, request_id: str) -> str:
+        if self.batch_claims:
+            return await self._queue_claim(request_id)
+        async with redis_cb.guard():
+            with IDEMPOTENCY_LATENCY.labels(op="claim").time():
+                previous = await self.redis.set(request_id, IN_PROGRESS_VALUE, nx=True, get=True, ex=IDEMPOTENCY_CLAIM_TTL)
+        return _claim_outcome(previous)
+
+    async def claim_many(self, request_ids: List[str]) -> List[str]:
+        """Claim a whole window of request ids in one pipelined round-trip."""
+        if not request_ids:
+            return []
+        async with redis_cb.guard():
+            with IDEMPOTENCY_LATENCY.labels(op="claim_many").time():
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for request_id in request_ids:
+                        pipe.set(request_id, IN_PROGRESS_VALUE, nx=True, get=True, ex=IDEMPOTENCY_CLAIM_TTL)
+                    results = await pipe.execute()
+        return [_claim_outcome(previous) for previous in results]
+
+    async def confirm(self, request_id: str):
+        async with redis_cb.guard():
+            with IDEMPOTENCY_LATENCY.labels(op="confirm").time():
+                await self.redis.set(request_id, DONE_VALUE, ex=IDEMPOTENCY_TTL)
+
+    async def confirm_many(self, request_ids: List[str]):
+        async with redis_cb.guard():
+            with IDEMPOTENCY_LATENCY.labels(op="confirm_many").time():
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for request_id in request_ids:
+                        pipe.set(request_id, DONE_VALUE, ex=IDEMPOTENCY_TTL)
+                    await pipe.execute()
+
+    async def release(self, request_id: str):
+        async with redis_cb.guard():
+            with IDEMPOTENCY_LATENCY.labels(op="release").time():
+                await self._release(keys=[request_id], args=[IN_PROGRESS_VALUE])
+
+    async def claim_ttl(self, request_id: str) -> float:
+        """Seconds until an in-progress claim expires; 0 if it is already gone."""
+        async with redis_cb.guard():
+            with IDEMPOTENCY_LATENCY.labels(op="claim_ttl").time():
+                remaining = await self.redis.pttl(request_id)
+        return max(remaining, 0) / 1000
+
+    async def flush(self):
+        """Wait for any queued batch claims to be sent."""
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+
+    async def _queue_claim(self, request_id: str) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((request_id, future))
+        if self._flush_task is None or self._flush_task.done():
+            # runs after every handler already scheduled this tick has queued its claim
+            self._flush_task = loop.create_task(self._flush_claims())
+        return await future
+
+    async def _flush_claims(self):
+        # claims queued while a round-trip is outstanding go out in the next one
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                outcomes = await self.claim_many([request_id for request_id, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for (_, future), outcome in zip(batch, outcomes):
+                if not future.done():
+                    future.set_result(outcome)
 
 
 async def create_redis_pool() -> redis.Redis:
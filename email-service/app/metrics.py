@@ -0,0 +1,49 @@
+# app/metrics.py
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# buckets span sub-millisecond Redis calls up to slow SMTP relays
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_QUEUE_WAIT_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 300, 900, 3600, 14400)
+
+QUEUE_WAIT = Histogram(
+    "email_queue_wait_seconds", "Time from publish to the consumer picking the message up",
+    ["lane"], buckets=_QUEUE_WAIT_BUCKETS,
+)
+PROCESS_LATENCY = Histogram(
+    "email_process_seconds", "End-to-end handling time of one queue message",
+    ["outcome", "lane"], buckets=_LATENCY_BUCKETS,
+)
+RENDER_LATENCY = Histogram(
+    "email_render_seconds", "Template rendering time",
+    ["mode"], buckets=_LATENCY_BUCKETS,
+)
+SMTP_SEND_LATENCY = Histogram(
+    "email_smtp_send_seconds", "SMTP send time including pool checkout",
+    buckets=_LATENCY_BUCKETS,
+)
+IDEMPOTENCY_LATENCY = Histogram(
+    "email_idempotency_seconds", "Redis idempotency round-trip time",
+    ["op"], buckets=_LATENCY_BUCKETS,
+)
+RETRIES = Counter("email_retries_total", "Messages scheduled for a delayed retry")
+DLQ_MOVES = Counter("email_dlq_total", "Messages moved to the dead letter queue")
+DUPLICATES_SKIPPED = Counter("email_duplicates_skipped_total", "Messages skipped as already processed")
+CIRCUIT_STATE_CHANGES = Counter(
+    "circuit_breaker_state_changes_total", "Circuit breaker transitions",
+    ["breaker", "state"],
+)
+CIRCUIT_STATE = Gauge(
+    "circuit_breaker_state", "Current breaker state (0=closed, 1=half-open, 2=open)",
+    ["breaker"],
+)
+
+_STATE_VALUES = {"CLOSED": 0, "HALF": 1, "OPEN": 2}
+
+
+def record_circuit_state(name: str, state: str):
+    CIRCUIT_STATE_CHANGES.labels(breaker=name, state=state).inc()
+    CIRCUIT_STATE.labels(breaker=name).set(_STATE_VALUES.get(state, -1))
+
+
+def render_latest():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,201 @@
+# app/rate_limit.py
+import asyncio
+import contextlib
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+import aiosmtplib
+from app.smtp_pool import SMTP_POOL_SIZE
+
+# sends/second allowed to the relay; 0 disables host-level shaping
+SMTP_RATE_PER_SECOND = float(os.getenv("SMTP_RATE_PER_SECOND", "0"))
+SMTP_RATE_BURST = int(os.getenv("SMTP_RATE_BURST", "10"))
+# per recipient domain, e.g. "gmail.com=5:10,yahoo.com=2" (rate[:burst])
+SMTP_DOMAIN_RATES = os.getenv("SMTP_DOMAIN_RATES", "")
+SMTP_MIN_CONCURRENCY = int(os.getenv("SMTP_MIN_CONCURRENCY", "1"))
+SMTP_MAX_CONCURRENCY = int(os.getenv("SMTP_MAX_CONCURRENCY", str(SMTP_POOL_SIZE)))
+SMTP_INITIAL_CONCURRENCY = int(os.getenv("SMTP_INITIAL_CONCURRENCY", str(min(2, SMTP_MAX_CONCURRENCY))))
+SMTP_BACKOFF_FACTOR = float(os.getenv("SMTP_BACKOFF_FACTOR", "0.5"))
+# a send slower than this counts as congestion; one slower than TOLERANCE x the smoothed
+# latency only holds the limit where it is
+SMTP_LATENCY_TARGET = float(os.getenv("SMTP_LATENCY_TARGET_SECONDS", "5"))
+SMTP_LATENCY_TOLERANCE = float(os.getenv("SMTP_LATENCY_TOLERANCE", "3"))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def refund(self):
+        self._tokens = min(self.burst, self._tokens + 1)
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit that grows by roughly one slot per window of successful
+    sends and is multiplied by SMTP_BACKOFF_FACTOR on throttling replies
+    (421 / 4xx) or sends over the latency target, at most once per latency
+    window. Sends well above the smoothed latency stop growth without backing
+    off, and every send feeds the smoothing, so a lasting shift in latency
+    (a new relay or route) becomes the new baseline instead of pinning the limit.
+    """
+
+    def __init__(self, initial: int = SMTP_INITIAL_CONCURRENCY, minimum: int = SMTP_MIN_CONCURRENCY,
+                 maximum: int = SMTP_MAX_CONCURRENCY, backoff: float = SMTP_BACKOFF_FACTOR,
+                 latency_target: float = SMTP_LATENCY_TARGET, latency_tolerance: float = SMTP_LATENCY_TOLERANCE):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.latency_tolerance = latency_tolerance
+        self.smoothed_latency: Optional[float] = None
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._waiters: List[asyncio.Future] = []
+
+    async def acquire(self):
+        while self._in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self._in_flight += 1
+
+    def try_acquire(self) -> bool:
+        if self._in_flight >= int(self.limit):
+            return False
+        self._in_flight += 1
+        return True
+
+    def cancel(self):
+        """Give back a slot that was never used for a send; the limit is left alone."""
+        self._in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        # waiters re-check the limit themselves
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _rising(self, latency: float) -> bool:
+        return self.smoothed_latency is not None and latency > self.latency_tolerance * self.smoothed_latency
+
+    def release(self, latency: float, outcome: str = "ok"):
+        """outcome is "ok", "throttled" (421/4xx) or "error" (any other failure, which leaves the limit alone)."""
+        self._in_flight -= 1
+        now = time.monotonic()
+        if outcome == "throttled" or (outcome == "ok" and latency > self.latency_target):
+            # one congestion event often fails several in-flight sends; back off once for it
+            if now - self._last_decrease > (self.smoothed_latency or latency):
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self._last_decrease = now
+        elif outcome == "ok" and not self._rising(latency):
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        if outcome == "ok":
+            self.smoothed_latency = latency if self.smoothed_latency is None else 0.9 * self.smoothed_latency + 0.1 * latency
+        self._wake()
+
+
+def _parse_domain_rates(spec: str) -> Dict[str, Tuple[float, int]]:
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        domain, _, value = item.partition("=")
+        rate, _, burst = value.partition(":")
+        rates[domain.strip().lower()] = (float(rate), int(burst) if burst else max(1, int(float(rate))))
+    return rates
+
+
+def is_throttle_reply(exc: BaseException) -> bool:
+    if isinstance(exc, aiosmtplib.SMTPRecipientsRefused):
+        return any(400 <= r.code < 500 for r in exc.recipients)
+    code = getattr(exc, "code", None)
+    return isinstance(code, int) and 400 <= code < 500
+
+
+class SendShaper:
+    """Token buckets for the relay and per recipient domain, plus AIMD concurrency."""
+
+    def __init__(self, rate: float = SMTP_RATE_PER_SECOND, burst: int = SMTP_RATE_BURST,
+                 domain_rates: str = SMTP_DOMAIN_RATES, limiter: Optional[AIMDLimiter] = None):
+        self.host_bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.domain_buckets = {
+            domain: TokenBucket(r, b) for domain, (r, b) in _parse_domain_rates(domain_rates).items()
+        }
+        self.limiter = limiter or AIMDLimiter()
+
+    def _buckets(self, recipient: str) -> List[TokenBucket]:
+        # recipient may be an address or just its domain
+        domain = recipient.rpartition("@")[2].lower()
+        return [bucket for bucket in (self.domain_buckets.get(domain), self.host_bucket) if bucket is not None]
+
+    async def acquire(self, recipient: str):
+        """Wait for a send slot; pair with release() after the send, or cancel() if it is not used."""
+        for bucket in self._buckets(recipient):
+            await bucket.acquire()
+        await self.limiter.acquire()
+
+    def try_acquire(self, recipient: str) -> bool:
+        """Take a send slot only if one is free right now."""
+        taken = []
+        for bucket in self._buckets(recipient):
+            if not bucket.try_acquire():
+                break
+            taken.append(bucket)
+        else:
+            if self.limiter.try_acquire():
+                return True
+        for bucket in taken:
+            bucket.refund()
+        return False
+
+    def release(self, latency: float, exc: Optional[BaseException] = None):
+        if exc is None:
+            self.limiter.release(latency)
+        else:
+            self.limiter.release(latency, "throttled" if is_throttle_reply(exc) else "error")
+
+    def cancel(self, recipient: str):
+        for bucket in self._buckets(recipient):
+            bucket.refund()
+        self.limiter.cancel()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, recipient: str):
+        await self.acquire(recipient)
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as exc:
+            self.release(time.monotonic() - started, exc)
+            raise
+        else:
+            self.release(time.monotonic() - started)
@@ -0,0 +1,147 @@
+# app/smtp_batch.py
+import asyncio
+import contextlib
+import os
+import time
+from collections import defaultdict, deque
+from email.message import EmailMessage
+from typing import Deque, Dict, Optional
+import aiosmtplib
+from app.circuit_breaker import CircuitBreaker, CircuitOpen
+from app.smtp_pool import SMTPConnectionPool
+from app.rate_limit import SendShaper
+from app.metrics import SMTP_SEND_LATENCY
+
+# messages sent back-to-back on one pooled session before it is handed back
+SMTP_BATCH_MAX_MESSAGES = int(os.getenv("SMTP_BATCH_MAX_MESSAGES", "20"))
+
+
+class DomainBatcher:
+    """
+    Groups concurrent sends by recipient domain and sends each group on a single
+    pooled SMTP session, one transaction after another. Messages queue per domain
+    while a session is checked out; a drainer then sends whatever has queued (up
+    to max_messages) before handing the session back, so batches grow with load
+    and a lone message is not delayed. Every message keeps its own future, so
+    callers still see (and ack, mark, retry) their own outcome.
+
+    Commands are not pipelined: aiosmtplib reads one reply per command and would
+    drop replies that arrive together, so batching only saves the per-message
+    pool checkout, health check and reconnects.
+    """
+
+    def __init__(self, pool: SMTPConnectionPool, shaper: Optional[SendShaper] = None,
+                 max_messages: int = SMTP_BATCH_MAX_MESSAGES, breaker: Optional[CircuitBreaker] = None):
+        self.pool = pool
+        self.shaper = shaper
+        # guards the connect and each send, not the time spent queued or shaped
+        self.breaker = breaker
+        self.max_messages = max(1, max_messages)
+        # per domain: [message, future, retried] in arrival order
+        self._queues: Dict[str, Deque[list]] = defaultdict(deque)
+        self._drainers: Dict[str, int] = defaultdict(int)
+        self._tasks: set = set()
+        self.batches = 0
+        self.messages = 0
+
+    async def send(self, message: EmailMessage):
+        domain = message["To"].rpartition("@")[2].lower()
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues[domain]
+        queue.append([message, future, False])
+        drainers = self._drainers[domain]
+        # one drainer per max_messages of backlog, never more than the pool has sessions
+        if drainers < self.pool.size and len(queue) > drainers * self.max_messages:
+            self._drainers[domain] += 1
+            task = asyncio.create_task(self._drain(domain))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return await future
+
+    def _guard(self):
+        return self.breaker.guard() if self.breaker is not None else contextlib.nullcontext()
+
+    async def _send_one(self, smtp: aiosmtplib.SMTP, message: EmailMessage):
+        # the caller already holds this message's shaping slot; it is released here
+        started = time.monotonic()
+        try:
+            async with self._guard():
+                with SMTP_SEND_LATENCY.time():
+                    result = await smtp.send_message(message)
+        except BaseException as exc:
+            if self.shaper is not None:
+                self.shaper.release(time.monotonic() - started, exc)
+            raise
+        if self.shaper is not None:
+            self.shaper.release(time.monotonic() - started)
+        return result
+
+    async def _send_batch(self, queue: Deque[list], domain: str):
+        # shape before taking a session, so a throttled domain waits without holding one idle
+        held = False
+        if self.shaper is not None:
+            await self.shaper.acquire(domain)
+            held = True
+        taken = False
+        try:
+            if not queue:
+                return  # another drainer sent everything meanwhile
+            async with contextlib.AsyncExitStack() as stack:
+                async with self._guard():
+                    smtp = await stack.enter_async_context(self.pool.connection())
+                for _ in range(self.max_messages):
+                    if not queue:
+                        break
+                    if self.shaper is not None and not held:
+                        if not self.shaper.try_acquire(domain):
+                            break  # next slot isn't free yet: hand the session back and wait without it
+                        held = True
+                    item = queue.popleft()
+                    taken = True
+                    message, future, retried = item
+                    if future.done():
+                        continue
+                    held = False  # released by _send_one
+                    try:
+                        result = await self._send_one(smtp, message)
+                    except (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused, CircuitOpen) as exc:
+                        # the server rejected this message only (and sendmail sent RSET), or the
+                        # breaker did without touching the session; keep going
+                        future.set_exception(exc)
+                    except aiosmtplib.SMTPServerDisconnected as exc:
+                        # a stale pooled session fails on its first command; retry once on a fresh one
+                        if retried:
+                            future.set_exception(exc)
+                        else:
+                            queue.appendleft([message, future, True])
+                        raise
+                    except Exception as exc:
+                        future.set_exception(exc)
+                        raise
+                    else:
+                        self.messages += 1
+                        future.set_result(result)
+        except Exception as exc:
+            # the session is discarded by the pool; a failed connect is charged to the next message
+            if not taken and queue:
+                _, future, _ = queue.popleft()
+                if not future.done():
+                    future.set_exception(exc)
+        else:
+            if taken:
+                self.batches += 1
+        finally:
+            if held:
+                self.shaper.cancel(domain)
+
+    async def _drain(self, domain: str):
+        queue = self._queues[domain]
+        try:
+            while queue:
+                await self._send_batch(queue, domain)
+        finally:
+            self._drainers[domain] -= 1
+
+    async def close(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
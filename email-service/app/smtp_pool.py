@@ -0,0 +1,108 @@
+# app/smtp_pool.py
+import asyncio
+import contextlib
+import os
+import time
+from typing import Callable, List, Tuple
+import aiosmtplib
+
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "5"))
+SMTP_POOL_IDLE_TIMEOUT = float(os.getenv("SMTP_POOL_IDLE_TIMEOUT", "60"))
+# connections idle for longer than this are NOOP-checked before being reused
+SMTP_POOL_HEALTHCHECK_AFTER = float(os.getenv("SMTP_POOL_HEALTHCHECK_AFTER", "10"))
+
+
+class SMTPConnectionPool:
+    """
+    Keeps up to `size` connected (and, if configured, STARTTLS'd and authenticated)
+    aiosmtplib.SMTP sessions open and hands them out one caller at a time.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], aiosmtplib.SMTP],
+        size: int = SMTP_POOL_SIZE,
+        idle_timeout: float = SMTP_POOL_IDLE_TIMEOUT,
+        healthcheck_after: float = SMTP_POOL_HEALTHCHECK_AFTER,
+    ):
+        self._factory = factory
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.healthcheck_after = healthcheck_after
+        self._idle: List[Tuple[aiosmtplib.SMTP, float]] = []
+        self._slots = asyncio.Semaphore(size)
+        self._closed = False
+        self.connects = 0
+        self.reuses = 0
+
+    def _discard(self, smtp: aiosmtplib.SMTP):
+        with contextlib.suppress(Exception):
+            smtp.close()
+
+    def _reap_idle(self, now: float):
+        fresh = []
+        for smtp, last_used in self._idle:
+            if now - last_used > self.idle_timeout or not smtp.is_connected:
+                self._discard(smtp)
+            else:
+                fresh.append((smtp, last_used))
+        self._idle = fresh
+
+    async def _acquire(self) -> aiosmtplib.SMTP:
+        await self._slots.acquire()
+        try:
+            now = time.monotonic()
+            self._reap_idle(now)
+            while self._idle:
+                # most recently used first: the least likely to have been dropped by the server
+                smtp, last_used = self._idle.pop()
+                if now - last_used > self.healthcheck_after:
+                    try:
+                        await smtp.noop()
+                    except aiosmtplib.SMTPException:
+                        self._discard(smtp)
+                        continue
+                self.reuses += 1
+                return smtp
+            smtp = self._factory()
+            await smtp.connect()
+            self.connects += 1
+            return smtp
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, smtp: aiosmtplib.SMTP, healthy: bool):
+        if healthy and not self._closed and smtp.is_connected:
+            self._idle.append((smtp, time.monotonic()))
+        else:
+            self._discard(smtp)
+        self._slots.release()
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        smtp = await self._acquire()
+        healthy = False
+        try:
+            yield smtp
+            healthy = True
+        finally:
+            # after any error the session state is unknown, so never hand it out again
+            self._release(smtp, healthy)
+
+    async def send_message(self, message, **kwargs):
+        """Send on a pooled session, reconnecting once if the server dropped it."""
+        try:
+            async with self.connection() as smtp:
+                return await smtp.send_message(message, **kwargs)
+        except aiosmtplib.SMTPServerDisconnected:
+            async with self.connection() as smtp:
+                return await smtp.send_message(message, **kwargs)
+
+    async def close(self):
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            with contextlib.suppress(Exception):
+                await smtp.quit()
+            self._discard(smtp)
@@ -0,0 +1,185 @@
+# app/supervisor.py
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import time
+from typing import List, Optional
+
+CONSUMER_WORKERS = int(os.getenv("CONSUMER_WORKERS", "1"))
+# a worker whose event loop hasn't beaten for this long is considered hung and restarted
+WORKER_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", "2"))
+WORKER_HEARTBEAT_TIMEOUT = float(os.getenv("WORKER_HEARTBEAT_TIMEOUT", "30"))
+WORKER_MAX_RESTART_DELAY = float(os.getenv("WORKER_MAX_RESTART_DELAY", "60"))
+# a worker that stays up this long has its crash backoff reset
+WORKER_STABLE_AFTER = float(os.getenv("WORKER_STABLE_AFTER", "60"))
+# optional JSON file with per-worker status, rewritten every check (for container health checks)
+SUPERVISOR_STATUS_FILE = os.getenv("SUPERVISOR_STATUS_FILE", "")
+
+
+async def _worker_main(index: int, heartbeat):
+    from app import consumer
+    from app.email_sender import smtp_batcher, smtp_pool, close_http_client
+
+    loop = asyncio.get_running_loop()
+    consumer_task = asyncio.create_task(consumer.consume())
+    stopping = asyncio.Event()
+    # SIGTERM only: Ctrl-C reaches the whole process group, and the supervisor drains workers itself
+    loop.add_signal_handler(signal.SIGTERM, stopping.set)
+
+    async def beat():
+        while True:
+            heartbeat.value = time.time()
+            await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+
+    beater = asyncio.create_task(beat())
+    stop_requested = asyncio.create_task(stopping.wait())
+    try:
+        await asyncio.wait({consumer_task, stop_requested}, return_when=asyncio.FIRST_COMPLETED)
+        if stopping.is_set():
+            await consumer.drain(consumer_task)
+            return 0
+        # consume() only returns early on an error (e.g. lost broker); let the supervisor restart us
+        exc = consumer_task.exception()
+        print(f"[worker {index}] consumer exited:", exc)
+        return 1
+    finally:
+        beater.cancel()
+        stop_requested.cancel()
+        await smtp_batcher.close()
+        await smtp_pool.close()
+        await close_http_client()
+
+
+def run_worker(index: int, heartbeat):
+    """Entry point of one worker process: a full consumer with its own connections."""
+    # the supervisor handles Ctrl-C for the process group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    print(f"[worker {index}] started, pid {os.getpid()}")
+    raise SystemExit(asyncio.run(_worker_main(index, heartbeat)))
+
+
+class WorkerSlot:
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[multiprocessing.Process] = None
+        self.heartbeat = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.crashes = 0
+        self.restart_at = 0.0
+
+
+class Supervisor:
+    """
+    Runs `workers` consumer processes on the same queues and keeps them running:
+    a worker that exits or stops heartbeating is restarted with exponential
+    backoff. SIGTERM/SIGINT drain every worker (see consumer.drain) before exiting.
+    """
+
+    def __init__(self, workers: int = CONSUMER_WORKERS, heartbeat_timeout: float = WORKER_HEARTBEAT_TIMEOUT,
+                 target=run_worker, status_file: str = SUPERVISOR_STATUS_FILE):
+        self.heartbeat_timeout = heartbeat_timeout
+        self.target = target
+        self.status_file = status_file
+        # spawn: workers start from a clean interpreter, not a fork of the supervisor's state
+        self._ctx = multiprocessing.get_context("spawn")
+        self.slots: List[WorkerSlot] = [WorkerSlot(i) for i in range(max(1, workers))]
+        self._stopping = False
+
+    def _start(self, slot: WorkerSlot):
+        slot.heartbeat = self._ctx.Value("d", time.time(), lock=False)
+        slot.process = self._ctx.Process(target=self.target, args=(slot.index, slot.heartbeat),
+                                         name=f"email-consumer-{slot.index}", daemon=False)
+        slot.process.start()
+        slot.started_at = time.time()
+
+    def _stop_process(self, slot: WorkerSlot, grace: float):
+        process = slot.process
+        if process is None or not process.is_alive():
+            return
+        process.terminate()
+        process.join(grace)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+    def _schedule_restart(self, slot: WorkerSlot, reason: str):
+        now = time.time()
+        if now - slot.started_at > WORKER_STABLE_AFTER:
+            slot.crashes = 0
+        slot.crashes += 1
+        delay = min(2 ** (slot.crashes - 1), WORKER_MAX_RESTART_DELAY)
+        slot.restart_at = now + delay
+        slot.process = None
+        print(f"[supervisor] worker {slot.index} {reason}; restarting in {delay:.0f}s")
+
+    def check(self):
+        """One supervision pass: restart dead or hung workers whose backoff has elapsed."""
+        now = time.time()
+        for slot in self.slots:
+            if slot.process is None:
+                if now >= slot.restart_at:
+                    slot.restarts += 1
+                    self._start(slot)
+                continue
+            if not slot.process.is_alive():
+                self._schedule_restart(slot, f"exited with code {slot.process.exitcode}")
+            elif now - slot.heartbeat.value > self.heartbeat_timeout:
+                self._stop_process(slot, grace=5)
+                self._schedule_restart(slot, f"missed heartbeats for {now - slot.heartbeat.value:.0f}s")
+        if self.status_file:
+            self._write_status(now)
+
+    def status(self) -> List[dict]:
+        now = time.time()
+        return [{
+            "worker": slot.index,
+            "pid": slot.process.pid if slot.process else None,
+            "alive": bool(slot.process and slot.process.is_alive()),
+            "heartbeat_age": round(now - slot.heartbeat.value, 1) if slot.heartbeat is not None else None,
+            "restarts": slot.restarts,
+        } for slot in self.slots]
+
+    def _write_status(self, now: float):
+        tmp_path = f"{self.status_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"updated_at": now, "workers": self.status()}, f)
+        os.replace(tmp_path, self.status_file)
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def run(self, check_interval: float = 1.0):
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        for slot in self.slots:
+            self._start(slot)
+        print(f"[supervisor] running {len(self.slots)} consumer workers")
+        while not self._stopping:
+            self.check()
+            time.sleep(check_interval)
+        self.stop()
+
+    def stop(self):
+        from app.consumer import SHUTDOWN_DRAIN_SECONDS
+        print("[supervisor] draining workers")
+        alive = [slot.process for slot in self.slots if slot.process is not None and slot.process.is_alive()]
+        for process in alive:
+            process.terminate()  # SIGTERM: the worker drains in-flight messages
+        deadline = time.time() + SHUTDOWN_DRAIN_SECONDS + 10
+        for process in alive:
+            process.join(max(0.0, deadline - time.time()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run email consumer worker processes without the HTTP app.")
+    parser.add_argument("--workers", type=int, default=CONSUMER_WORKERS,
+                        help="consumer processes sharing the queues (default: CONSUMER_WORKERS or 1)")
+    args = parser.parse_args(argv)
+    Supervisor(args.workers).run()
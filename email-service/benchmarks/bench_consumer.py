@@ -0,0 +1,67 @@
+"""
+Messages/sec of app.consumer.run_workers as the in-flight limit grows.
+
+Uses the in-memory broker, fakeredis for idempotency and a fake SMTP sink with
+a fixed per-send latency, so the numbers isolate the consumer's scheduling.
+
+    python benchmarks/bench_consumer.py --messages 2000 --smtp-latency 0.02 --concurrency 1,4,16,64
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakeredis  # noqa: E402
+import fakeredis.aioredis  # noqa: E402
+
+from app import consumer  # noqa: E402
+from app.idempotency import Idempotency  # noqa: E402
+from benchmarks.standins import FakeSMTPSink, InMemoryBroker, make_payload, percentile  # noqa: E402
+
+
+async def run_once(messages: int, concurrency: int, smtp_latency: float):
+    sink = FakeSMTPSink(smtp_latency)
+    consumer.send_email = sink.send_email
+    consumer.idemp = Idempotency(fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True))
+
+    broker = InMemoryBroker()
+    for i in range(messages):
+        broker.put(make_payload(i))
+
+    started = time.perf_counter()
+    workers = asyncio.create_task(consumer.run_workers(broker, broker.exchange, concurrency))
+    await broker.wait_idle()
+    elapsed = time.perf_counter() - started
+    broker.close()
+    await workers
+    return {
+        "concurrency": concurrency,
+        "msg_per_s": sink.sent / elapsed,
+        "p50_ms": percentile(broker.latencies, 50) * 1000,
+        "p99_ms": percentile(broker.latencies, 99) * 1000,
+        "republished": len(broker.exchange.published),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--smtp-latency", type=float, default=0.02, help="seconds per fake SMTP send")
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    args = parser.parse_args()
+
+    print(f"{'N':>4} {'msg/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'retry/dlq':>10}")
+    for n in (int(x) for x in args.concurrency.split(",")):
+        # the consumer prints per message; keep the table readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = asyncio.run(run_once(args.messages, n, args.smtp_latency))
+        print(f"{result['concurrency']:>4} {result['msg_per_s']:>10.1f} {result['p50_ms']:>10.1f} {result['p99_ms']:>10.1f} {result['republished']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Per-message cost of decoding and validating a queue body into a payload.
+
+Compares the original path (bytes -> str -> json.loads -> EmailMessagePayload
+-> .dict()) with each decoder in app.decoding that is installed, for a
+pre-rendered payload and a templated one with a handful of variables.
+
+    python benchmarks/bench_decode.py --iterations 50000
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import decoding  # noqa: E402
+from app.schemas import EmailMessagePayload  # noqa: E402
+from benchmarks.standins import make_payload  # noqa: E402
+
+PAYLOADS = {
+    "prerendered": make_payload(1, body="<html><body>" + "<p>Hello user 1, here is your weekly digest.</p>" * 30 + "</body></html>"),
+    "templated": make_payload(1, subject=None, body=None, template_name="welcome_email", variables={
+        "name": "Ada Lovelace", "app_name": "Notify", "code": "123456", "plan": "pro",
+        "link": "https://example.com/verify?token=abcdef0123456789", "expires": "15 minutes",
+    }, metadata={"language": "en", "priority": "high"}),
+}
+
+
+# bodies every decoder must agree on: accepted with the same fields, or rejected
+PARITY_CASES = [
+    PAYLOADS["prerendered"],
+    PAYLOADS["templated"],
+    make_payload(2, to=5, variables={"code": 1234, "ok": True}),
+    make_payload(3, variables=None, metadata=None),
+    make_payload(4, variables={"nested": {"a": 1}}),
+    make_payload(5, to=None),
+    {"to": "user@example.com"},
+    dict(make_payload(6), unknown_field="ignored"),
+]
+FIELDS = ("request_id", "to", "subject", "body", "template_name", "variables", "metadata")
+
+
+def legacy(body: bytes):
+    return EmailMessagePayload(**json.loads(body.decode())).dict()
+
+
+def _outcome(decode, body: bytes):
+    try:
+        payload = decode(body)
+    except ValueError:
+        return "rejected"
+    return tuple((field, getattr(payload, field)) for field in FIELDS)
+
+
+def check_parity(decoders) -> bool:
+    """Every decoder must accept and reject the same bodies, with the same field values."""
+    ok = True
+    for case in PARITY_CASES:
+        body = json.dumps(case).encode()
+        outcomes = {name: _outcome(decode, body) for name, decode in decoders}
+        first = next(iter(outcomes.values()))
+        if any(outcome != first for outcome in outcomes.values()):
+            ok = False
+            print(f"decoders disagree on {body!r}:")
+            for name, outcome in outcomes.items():
+                print(f"  {name}: {outcome}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    decoders = [("legacy", legacy), ("json", decoding._decode_json)]
+    if decoding.orjson is not None:
+        decoders.append(("orjson", decoding._decode_orjson))
+    if decoding.msgspec is not None:
+        decoders.append(("msgspec", decoding._decode_msgspec))
+
+    if not check_parity(decoders[1:]):
+        sys.exit(1)
+    print(f"auto-selected decoder: {decoding.DECODER_NAME}; parity check passed")
+    print(f"{'payload':<12} {'bytes':>6} {'decoder':<8} {'us/msg':>8} {'msg/s':>10}")
+    for name, payload in PAYLOADS.items():
+        body = json.dumps(payload).encode()
+        for decoder_name, decode in decoders:
+            elapsed = min(timeit.repeat(lambda: decode(body), number=args.iterations, repeat=3))
+            per_call = elapsed / args.iterations
+            print(f"{name:<12} {len(body):>6} {decoder_name:<8} {per_call * 1e6:>8.2f} {1 / per_call:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Idempotency round-trip cost per message: legacy check+mark, claim+confirm,
+and pipelined claims for a whole prefetch window.
+
+    python benchmarks/bench_idempotency.py --messages 5000 --window 10
+    python benchmarks/bench_idempotency.py --redis-url redis://localhost:6379/15
+
+Uses fakeredis unless --redis-url is given; fakeredis has no network, so the
+pipelining gain shows up properly only against a real Redis.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakeredis  # noqa: E402
+import fakeredis.aioredis  # noqa: E402
+import redis.asyncio as redis  # noqa: E402
+
+from app.idempotency import Idempotency  # noqa: E402
+
+
+async def legacy(idemp: Idempotency, ids, window: int):
+    for request_id in ids:
+        if not await idemp.is_processed(request_id):
+            await idemp.mark_processed(request_id)
+
+
+async def claim_confirm(idemp: Idempotency, ids, window: int):
+    for request_id in ids:
+        await idemp.claim(request_id)
+        await idemp.confirm(request_id)
+
+
+async def claim_many(idemp: Idempotency, ids, window: int):
+    for start in range(0, len(ids), window):
+        chunk = ids[start:start + window]
+        await idemp.claim_many(chunk)
+        await idemp.confirm_many(chunk)
+
+
+async def coalesced(idemp: Idempotency, ids, window: int):
+    idemp.batch_claims = True
+    for start in range(0, len(ids), window):
+        # a prefetch window of handlers claiming concurrently, as in run_workers
+        await asyncio.gather(*(idemp.claim(request_id) for request_id in ids[start:start + window]))
+        await asyncio.gather(*(idemp.confirm(request_id) for request_id in ids[start:start + window]))
+
+
+async def main_async(args):
+    if args.redis_url:
+        client = redis.from_url(args.redis_url, decode_responses=True)
+    else:
+        client = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+    print(f"{'mode':<14} {'msg/s':>12} {'us/msg':>10}")
+    for name, fn in (("check+mark", legacy), ("claim+confirm", claim_confirm),
+                     ("claim_many", claim_many), ("coalesced", coalesced)):
+        idemp = Idempotency(client)
+        ids = [f"bench:{uuid.uuid4()}" for _ in range(args.messages)]
+        started = time.perf_counter()
+        await fn(idemp, ids, args.window)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<14} {args.messages / elapsed:>12.1f} {elapsed / args.messages * 1e6:>10.1f}")
+        await client.delete(*ids)
+    await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--window", type=int, default=10, help="claims per pipeline (prefetch window)")
+    parser.add_argument("--redis-url", default=None)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
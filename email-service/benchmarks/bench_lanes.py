@@ -0,0 +1,109 @@
+"""
+Transactional latency while a bulk campaign is being drained.
+
+Queues --bulk campaign messages on the bulk lane, then trickles --transactional
+messages in at --rate per second, and reports the transactional messages'
+enqueue-to-ack latency and how much bulk work finished meanwhile. With --single-lane everything shares the bulk queue, as before lanes
+existed. Both lanes share one fake relay that allows --relay-slots concurrent
+sends, so the transactional lane still competes for SMTP, just not for a
+place in the queue.
+
+    python benchmarks/bench_lanes.py --bulk 20000 --transactional 200
+    python benchmarks/bench_lanes.py --bulk 20000 --transactional 200 --single-lane
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakeredis  # noqa: E402
+import fakeredis.aioredis  # noqa: E402
+
+from app import consumer  # noqa: E402
+from app.idempotency import Idempotency  # noqa: E402
+from benchmarks.standins import InMemoryBroker, make_payload, percentile  # noqa: E402
+
+
+class SharedRelay:
+    def __init__(self, slots: int, latency: float):
+        self.slots = asyncio.Semaphore(slots)
+        self.latency = latency
+
+    async def send_email(self, payload):
+        async with self.slots:
+            await asyncio.sleep(self.latency)
+        return True
+
+
+async def run(args):
+    relay = SharedRelay(args.relay_slots, args.smtp_latency)
+    consumer.send_email = relay.send_email
+    consumer.idemp = Idempotency(fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True))
+
+    transactional_lane, bulk_lane = consumer.LANES
+    bulk = InMemoryBroker()
+    transactional = bulk if args.single_lane else InMemoryBroker()
+    for i in range(args.bulk):
+        bulk.put(make_payload(i))
+
+    workers = [asyncio.create_task(consumer.run_workers(bulk, bulk.exchange, args.bulk_concurrency, bulk_lane))]
+    if not args.single_lane:
+        workers.append(asyncio.create_task(consumer.run_workers(
+            transactional, transactional.exchange, args.transactional_concurrency, transactional_lane)))
+
+    # tag transactional messages so their latencies can be told apart on a shared broker
+    tagged = set()
+    original_settled = transactional.settled
+    transactional_latencies = []
+
+    def settled(message):
+        original_settled(message)
+        if id(message) in tagged:
+            transactional_latencies.append(transactional.latencies[-1])
+    transactional.settled = settled
+
+    for i in range(args.transactional):
+        tagged.add(id(transactional.put(make_payload(args.bulk + i, subject="Your code"))))
+        await asyncio.sleep(1 / args.rate)
+    while len(transactional_latencies) < args.transactional:
+        await asyncio.sleep(0.05)
+
+    bulk_done = len(bulk.latencies) - (len(transactional_latencies) if args.single_lane else 0)
+    for broker in {id(b): b for b in (bulk, transactional)}.values():
+        broker.close()
+    for task in workers:
+        task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await asyncio.gather(*workers)
+    return transactional_latencies, bulk_done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bulk", type=int, default=20000)
+    parser.add_argument("--transactional", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=20, help="transactional messages per second")
+    parser.add_argument("--smtp-latency", type=float, default=0.02)
+    parser.add_argument("--relay-slots", type=int, default=20)
+    parser.add_argument("--bulk-concurrency", type=int, default=consumer.CONSUMER_CONCURRENCY)
+    parser.add_argument("--transactional-concurrency", type=int, default=consumer.TRANSACTIONAL_CONCURRENCY)
+    parser.add_argument("--single-lane", action="store_true")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        latencies, bulk_done = asyncio.run(run(args))
+    elapsed = time.perf_counter() - started
+    mode = "single lane" if args.single_lane else "lanes"
+    print(f"{mode}: transactional p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} ms; "
+          f"{bulk_done} bulk messages sent meanwhile ({elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
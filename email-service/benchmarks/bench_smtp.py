@@ -0,0 +1,113 @@
+"""
+Per-message aiosmtplib.send vs the pooled sessions in app.smtp_pool vs
+domain batches on pooled sessions (app.smtp_batch).
+
+Starts a local aiosmtpd sink that accepts and discards mail, then sends the
+same messages each way at a fixed concurrency. Recipients are spread over
+--domains domains. The sink has no TLS or AUTH, so against a real relay
+(STARTTLS + login per connection) the gap is larger.
+
+    python benchmarks/bench_smtp.py --messages 1000 --concurrency 50 --pool-size 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from email.message import EmailMessage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiosmtplib  # noqa: E402
+from aiosmtpd.controller import Controller  # noqa: E402
+
+from app.smtp_pool import SMTPConnectionPool  # noqa: E402
+from app.smtp_batch import DomainBatcher  # noqa: E402
+from benchmarks.standins import percentile  # noqa: E402
+
+
+class SinkHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+
+def build_message(i: int, domains: int) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = "bench@example.com"
+    message["To"] = f"user{i}@example{i % domains}.com"
+    message["Subject"] = "Welcome"
+    message.set_content(f"<p>Hello user {i}</p>", subtype="html")
+    return message
+
+
+async def run(send, messages: int, concurrency: int, domains: int):
+    latencies = []
+    counter = iter(range(messages))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            await send(build_message(i, domains))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+
+async def main_async(args, host: str, port: int):
+    async def send_per_message(message):
+        await aiosmtplib.send(message, hostname=host, port=port, start_tls=False)
+
+    def new_pool():
+        return SMTPConnectionPool(
+            lambda: aiosmtplib.SMTP(hostname=host, port=port, start_tls=False),
+            size=args.pool_size,
+        )
+
+    pool = new_pool()
+    batch_pool = new_pool()
+    batcher = DomainBatcher(batch_pool, max_messages=args.batch_size)
+
+    results = []
+    modes = (("per-message", send_per_message), ("pooled", pool.send_message), ("batched", batcher.send))
+    for name, send in modes:
+        latencies, elapsed = await run(send, args.messages, args.concurrency, args.domains)
+        results.append((name, len(latencies) / elapsed, percentile(latencies, 50), percentile(latencies, 99)))
+    await batcher.close()
+    await pool.close()
+    await batch_pool.close()
+    return results, pool, batcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--pool-size", type=int, default=5)
+    parser.add_argument("--domains", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8125)
+    args = parser.parse_args()
+
+    handler = SinkHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=args.port)
+    controller.start()
+    try:
+        results, pool, batcher = asyncio.run(main_async(args, "127.0.0.1", args.port))
+    finally:
+        controller.stop()
+
+    print(f"{'mode':<12} {'msg/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for name, rate, p50, p99 in results:
+        print(f"{name:<12} {rate:>10.1f} {p50 * 1000:>10.2f} {p99 * 1000:>10.2f}")
+    print(f"pool: {pool.connects} connects, {pool.reuses} reuses; "
+          f"batched: {batcher.messages} messages in {batcher.batches} batches; sink received {handler.received}")
+
+
+if __name__ == "__main__":
+    main()
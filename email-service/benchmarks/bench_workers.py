@@ -0,0 +1,114 @@
+"""
+Consumer throughput as worker processes are added (python -m app.consumer --workers N).
+
+Each process runs app.consumer.run_workers over its share of the messages with
+the real send_email path: local template rendering, EmailMessage building and
+flattening the message as aiosmtplib does before writing it. Only the network
+is stubbed (the pooled SMTP send and the template fetch), so the work is the
+CPU-bound part a single event loop is capped by. Reports aggregate msg/s per
+worker count; scaling is bounded by the cores available.
+
+    python benchmarks/bench_workers.py --messages 20000 --workers 1,2,4
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+TEMPLATE_BODY = (
+    "<html><body><h1>Hi {{ name }}</h1><p>Welcome to {{ app_name }}. Your code is <b>{{ code }}</b>.</p>"
+    + "<p>{{ name }}, here is some more text to make the body a realistic size.</p>" * 20
+    + "</body></html>"
+)
+
+
+class FlatteningPool:
+    """Stands in for SMTPConnectionPool: serializes the message like a real send, without the socket."""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, message, **kwargs):
+        message.as_bytes()
+        self.sent += 1
+
+
+async def _run_share(first: int, count: int, concurrency: int):
+    import fakeredis
+    import fakeredis.aioredis
+    from app import consumer, email_sender
+    from app.idempotency import Idempotency
+    from benchmarks.standins import InMemoryBroker, make_payload
+
+    email_sender.TEMPLATE_RENDER_MODE = "local"
+    email_sender.fetched_templates.put(("bench_welcome", "en"), (
+        email_sender._subject_env.from_string("Welcome {{ name }}"),
+        email_sender._body_env.from_string(TEMPLATE_BODY),
+    ))
+    email_sender.smtp_pool = pool = FlatteningPool()
+    consumer.idemp = Idempotency(fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True))
+
+    broker = InMemoryBroker()
+    for i in range(first, first + count):
+        broker.put(make_payload(i, subject=None, body=None, template_name="bench_welcome",
+                                variables={"name": f"user{i}", "app_name": "bench", "code": str(i)}))
+    broker.close()
+    await consumer.run_workers(broker, broker.exchange, concurrency)
+    return pool.sent
+
+
+def worker(first: int, count: int, concurrency: int, start, results):
+    os.environ.setdefault("SMTP_USERNAME", "bench")
+    os.environ.setdefault("SMTP_PASSWORD", "bench")
+    start.wait()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        sent = asyncio.run(_run_share(first, count, concurrency))
+    results.put((sent, time.perf_counter() - started))
+
+
+def run(workers: int, messages: int, concurrency: int):
+    ctx = multiprocessing.get_context("spawn")
+    start = ctx.Event()
+    results = ctx.Queue()
+    share = messages // workers
+    processes = [ctx.Process(target=worker, args=(i * share, share, concurrency, start, results))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    # let every interpreter finish importing before the clock starts
+    time.sleep(2 + workers * 0.5)
+    start.set()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    sent = sum(s for s, _ in outcomes)
+    elapsed = max(e for _, e in outcomes)
+    return sent, sent / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--concurrency", type=int, default=32, help="in-flight messages per worker")
+    args = parser.parse_args()
+
+    print(f"cores available: {len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()}")
+    print(f"{'workers':>7} {'sent':>8} {'msg/s':>10} {'speedup':>8}")
+    baseline = None
+    for n in (int(x) for x in args.workers.split(",")):
+        sent, rate = run(n, args.messages, args.concurrency)
+        baseline = baseline or rate
+        print(f"{n:>7} {sent:>8} {rate:>10.1f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+In-process stand-ins for the brokers the consumer talks to, so benchmarks can
+drive app.consumer without RabbitMQ, Redis or a real SMTP relay.
+"""
+import asyncio
+import contextlib
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+
+class FakeMessage:
+    """Just enough of aio_pika.IncomingMessage for app.consumer."""
+
+    def __init__(self, body: bytes, headers: Optional[Dict[str, Any]] = None, broker: "InMemoryBroker" = None):
+        self.body = body
+        self.headers = headers or {}
+        self.timestamp = None
+        self.enqueued_at = time.perf_counter()
+        self.processed = False
+        self.requeued = False
+        self._broker = broker
+
+    async def nack(self, requeue: bool = True):
+        self.processed = True
+        self.requeued = requeue
+        self._broker.nacked += 1
+
+    @contextlib.asynccontextmanager
+    async def process(self, requeue: bool = False, ignore_processed: bool = False):
+        try:
+            yield self
+        except BaseException:
+            if not (ignore_processed and self.processed):
+                self.processed = True
+                self._broker.nacked += 1
+            raise
+        else:
+            if not (ignore_processed and self.processed):
+                self.processed = True
+                self._broker.acked += 1
+        finally:
+            self._broker.settled(self)
+
+
+class FakeExchange:
+    def __init__(self, broker: "InMemoryBroker"):
+        self._broker = broker
+        self.published: List[Any] = []
+
+    async def publish(self, message, routing_key: str = "", **kwargs):
+        self.published.append((routing_key, message))
+
+
+class InMemoryBroker:
+    """
+    A single in-memory queue with prefetch-free delivery. Iterating it yields
+    FakeMessages until `close()` is called and the queue is empty.
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._closed = False
+        self.exchange = FakeExchange(self)
+        self.acked = 0
+        self.nacked = 0
+        self.latencies: List[float] = []
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def put(self, payload: Dict[str, Any], headers: Optional[Dict[str, Any]] = None) -> FakeMessage:
+        self._pending += 1
+        self._idle.clear()
+        message = FakeMessage(json.dumps(payload).encode(), headers, self)
+        self._queue.put_nowait(message)
+        return message
+
+    def settled(self, message: FakeMessage):
+        self.latencies.append(time.perf_counter() - message.enqueued_at)
+        self._pending -= 1
+        if self._pending == 0:
+            self._idle.set()
+
+    async def wait_idle(self):
+        await self._idle.wait()
+
+    def close(self):
+        self._closed = True
+        self._queue.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> FakeMessage:
+        message = await self._queue.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+
+class FakeSMTPSink:
+    """Accepts every send after a fixed delay that stands in for the SMTP round-trips."""
+
+    def __init__(self, latency: float = 0.02):
+        self.latency = latency
+        self.sent = 0
+
+    async def send_email(self, payload):
+        await asyncio.sleep(self.latency)
+        self.sent += 1
+        return True
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def make_payload(i: int, **overrides) -> Dict[str, Any]:
+    payload = {
+        "request_id": f"bench-{i}",
+        "to": f"user{i}@example.com",
+        "subject": "Welcome",
+        "body": f"<p>Hello user {i}</p>",
+    }
+    payload.update(overrides)
+    return payload
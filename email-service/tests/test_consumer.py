@@ -0,0 +1,66 @@
+import asyncio
+import contextlib
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakeredis  # noqa: E402
+import fakeredis.aioredis  # noqa: E402
+
+from app import consumer  # noqa: E402
+from app.idempotency import Idempotency  # noqa: E402
+
+
+class FakeMessage:
+    """Settles like aio_pika.IncomingMessage: process() acks, or rejects unless already settled."""
+
+    def __init__(self, payload):
+        self.body = json.dumps(payload).encode()
+        self.headers = {}
+        self.timestamp = None
+        self.processed = False
+        self.settled_as = None
+
+    async def nack(self, requeue: bool = True):
+        self.processed = True
+        self.settled_as = ("nack", requeue)
+
+    @contextlib.asynccontextmanager
+    async def process(self, requeue: bool = False, ignore_processed: bool = False):
+        try:
+            yield self
+        except BaseException:
+            if not (ignore_processed and self.processed):
+                self.processed = True
+                self.settled_as = ("reject", requeue)
+            raise
+        else:
+            if not (ignore_processed and self.processed):
+                self.processed = True
+                self.settled_as = ("ack", None)
+
+
+def test_cancelled_handler_requeues_and_releases_claim(monkeypatch):
+    async def run():
+        redis = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+        monkeypatch.setattr(consumer, "idemp", Idempotency(redis))
+        sending = asyncio.Event()
+
+        async def hang(payload):
+            sending.set()
+            await asyncio.sleep(60)
+        monkeypatch.setattr(consumer, "send_email", hang)
+
+        message = FakeMessage({"request_id": "r-1", "to": "a@example.com", "subject": "s", "body": "b"})
+        task = asyncio.create_task(consumer.handle_message(message, default_exchange=None))
+        await sending.wait()
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        return message, await redis.get("r-1")
+
+    message, claim = asyncio.run(run())
+    assert message.settled_as == ("nack", True)
+    assert claim is None
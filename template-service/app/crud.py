@@ -1,7 +1,21 @@
+import os
+import time
+from sqlalchemy import func, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager
 from sqlmodel import select, Session
-from typing import Optional, Tuple, List
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Dict, Iterator, Optional, Tuple, List
 from app.models import Template, TemplateVersion
 from app.schemas import TemplateVersionCreate
+from app.cache import compiled_templates, resolved_versions
+from app.metrics import RESOLVE_LATENCY
+
+# 0 disables caching of the template total shown in list metadata
+TEMPLATE_COUNT_CACHE_TTL = float(os.getenv("TEMPLATE_COUNT_CACHE_TTL_SECONDS", "0"))
+_template_count: Optional[Tuple[int, float]] = None
+# a concurrent writer taking the same version numbers makes a create (or a whole bulk batch) retry
+BULK_IMPORT_MAX_ATTEMPTS = int(os.getenv("BULK_IMPORT_MAX_ATTEMPTS", "3"))
 
 def get_template_by_code(session: Session, code: str) -> Optional[Template]:
     stmt = select(Template).where(Template.code == code)
@@ -13,51 +27,202 @@ def create_template_if_missing(session: Session, code: str, template_type: str =
         return tpl
     tpl = Template(code=code, template_type=template_type, default_language=default_language)
     session.add(tpl)
-    session.commit()
+    try:
+        session.commit()
+    except IntegrityError:
+        # a concurrent writer created the same code first (ux_template_code)
+        session.rollback()
+        return get_template_by_code(session, code)
     session.refresh(tpl)
+    invalidate_template_count()
     return tpl
 
 def create_template_version(session: Session, payload: TemplateVersionCreate) -> TemplateVersion:
     tpl = create_template_if_missing(session, payload.template_code, payload.template_type or "email", payload.language or "en")
-    # find latest version for this template + language
-    stmt = select(TemplateVersion).where(
-        TemplateVersion.template_id == tpl.id,
-        TemplateVersion.language == (payload.language or "en")
-    ).order_by(TemplateVersion.version_number.desc())
-    last = session.exec(stmt).first()
-    next_version = 1 if not last else last.version_number + 1
-    tv = TemplateVersion(
-        template_id=tpl.id,
-        language=payload.language or "en",
-        version_number=next_version,
-        subject=payload.subject,
-        body=payload.body,
-        changelog=payload.changelog
-    )
-    session.add(tv)
-    session.commit()
-    session.refresh(tv)
-    return tv
-
-def get_template_version(session: Session, template_code: str, language: str = "en", version_number: Optional[int] = None) -> Optional[TemplateVersion]:
-    tpl = get_template_by_code(session, template_code)
-    if not tpl:
-        return None
-    if version_number:
+    for attempt in range(1, BULK_IMPORT_MAX_ATTEMPTS + 1):
+        # find latest version for this template + language
         stmt = select(TemplateVersion).where(
             TemplateVersion.template_id == tpl.id,
-            TemplateVersion.language == language,
-            TemplateVersion.version_number == version_number
+            TemplateVersion.language == (payload.language or "en")
+        ).order_by(TemplateVersion.version_number.desc()).limit(1)
+        last = session.exec(stmt).first()
+        next_version = 1 if not last else last.version_number + 1
+        tv = TemplateVersion(
+            template_id=tpl.id,
+            language=payload.language or "en",
+            version_number=next_version,
+            subject=payload.subject,
+            body=payload.body,
+            changelog=payload.changelog
         )
-        return session.exec(stmt).first()
-    stmt = select(TemplateVersion).where(
-        TemplateVersion.template_id == tpl.id,
+        session.add(tv)
+        try:
+            session.commit()
+            break
+        except IntegrityError:
+            # a concurrent create took this version number; take the next one
+            session.rollback()
+            if attempt == BULK_IMPORT_MAX_ATTEMPTS:
+                raise
+    session.refresh(tv)
+    # older versions of this template/language are no longer served as "latest"
+    compiled_templates.invalidate(tpl.id, tv.language)
+    resolved_versions.invalidate(tpl.code, tv.language)
+    return tv
+
+def _bulk_insert_versions(session: Session, payloads: List[TemplateVersionCreate]) -> Tuple[List[TemplateVersion], Dict[int, str]]:
+    codes = {p.template_code for p in payloads}
+    # lock the existing templates so concurrent bulk imports of the same codes queue up
+    # instead of racing on version numbers (no-op on SQLite, which locks the whole file)
+    existing = session.exec(
+        select(Template).where(Template.code.in_(codes)).order_by(Template.id).with_for_update()
+    ).all()
+    templates: Dict[str, Template] = {}
+    for tpl in existing:
+        templates.setdefault(tpl.code, tpl)
+    new_templates = []
+    for p in payloads:
+        if p.template_code not in templates:
+            tpl = Template(code=p.template_code, template_type=p.template_type or "email", default_language=p.language or "en")
+            templates[p.template_code] = tpl
+            new_templates.append(tpl)
+    if new_templates:
+        session.add_all(new_templates)
+        # ux_template_code fails here if a concurrent import created one of these codes first
+        session.flush()
+
+    pairs = {(templates[p.template_code].id, p.language or "en") for p in payloads}
+    latest_rows = session.exec(
+        select(TemplateVersion.template_id, TemplateVersion.language, func.max(TemplateVersion.version_number))
+        .where(tuple_(TemplateVersion.template_id, TemplateVersion.language).in_(pairs))
+        .group_by(TemplateVersion.template_id, TemplateVersion.language)
+    ).all()
+    latest = {(template_id, language): number for template_id, language, number in latest_rows}
+
+    versions = []
+    for p in payloads:
+        pair = (templates[p.template_code].id, p.language or "en")
+        latest[pair] = latest.get(pair, 0) + 1
+        versions.append(TemplateVersion(
+            template_id=pair[0],
+            language=pair[1],
+            version_number=latest[pair],
+            subject=p.subject,
+            body=p.body,
+            changelog=p.changelog
+        ))
+    session.add_all(versions)
+    # the unique (template_id, language, version_number) index fails here if another writer won
+    session.flush()
+    return versions, {tpl.id: code for code, tpl in templates.items()}
+
+def bulk_create_template_versions(session: Session, payloads: List[TemplateVersionCreate]) -> List[TemplateVersion]:
+    """
+    Insert many versions in one transaction: templates and latest version numbers
+    are resolved with set-based queries, and the batch is retried as a whole if a
+    concurrent writer creates the same new templates or claims the same version
+    numbers first.
+    """
+    for attempt in range(1, BULK_IMPORT_MAX_ATTEMPTS + 1):
+        try:
+            versions, codes = _bulk_insert_versions(session, payloads)
+            # detach before commit so returning the rows doesn't reload each one
+            for tv in versions:
+                session.expunge(tv)
+            session.commit()
+            break
+        except IntegrityError:
+            session.rollback()
+            if attempt == BULK_IMPORT_MAX_ATTEMPTS:
+                raise
+    invalidate_template_count()
+    for template_id, language in {(tv.template_id, tv.language) for tv in versions}:
+        compiled_templates.invalidate(template_id, language)
+        resolved_versions.invalidate(codes[template_id], language)
+    return versions
+
+def iter_template_versions(session: Session, language: Optional[str] = None, latest_only: bool = False, batch_size: int = 500) -> Iterator[Tuple[TemplateVersion, Template]]:
+    """Stream versions with their template, ordered for a stable export, without loading them all."""
+    stmt = select(TemplateVersion, Template).join(Template)
+    if language:
+        stmt = stmt.where(TemplateVersion.language == language)
+    if latest_only:
+        stmt = _join_latest(stmt)
+    stmt = stmt.order_by(Template.id, TemplateVersion.language, TemplateVersion.version_number)
+    yield from session.exec(stmt.execution_options(yield_per=batch_size))
+
+def _template_version_stmt(template_code: str, language: str, version_number: Optional[int] = None):
+    # single round-trip: join on template code and let the composite index pick the row
+    stmt = select(TemplateVersion).join(Template).where(
+        Template.code == template_code,
         TemplateVersion.language == language
-    ).order_by(TemplateVersion.version_number.desc())
-    return session.exec(stmt).first()
+    ).options(contains_eager(TemplateVersion.template))
+    if version_number:
+        return stmt.where(TemplateVersion.version_number == version_number)
+    return stmt.order_by(TemplateVersion.version_number.desc()).limit(1)
+
+def get_template_version(session: Session, template_code: str, language: str = "en", version_number: Optional[int] = None) -> Optional[TemplateVersion]:
+    key = (template_code, language, version_number or None)
+    tv = resolved_versions.get(key)
+    if tv is not None:
+        return tv
+    with RESOLVE_LATENCY.labels(source="db").time():
+        tv = session.exec(_template_version_stmt(template_code, language, version_number)).first()
+    if tv is not None:
+        resolved_versions.put(key, tv)
+    return tv
+
+async def aget_template_version(session: AsyncSession, template_code: str, language: str = "en", version_number: Optional[int] = None) -> Optional[TemplateVersion]:
+    key = (template_code, language, version_number or None)
+    tv = resolved_versions.get(key)
+    if tv is not None:
+        return tv
+    with RESOLVE_LATENCY.labels(source="db").time():
+        result = await session.exec(_template_version_stmt(template_code, language, version_number))
+        tv = result.first()
+    if tv is not None:
+        resolved_versions.put(key, tv)
+    return tv
+
+def _join_latest(stmt):
+    # restrict a TemplateVersion select to the newest version of each (template, language)
+    latest = select(
+        TemplateVersion.template_id,
+        TemplateVersion.language,
+        func.max(TemplateVersion.version_number).label("version_number")
+    ).group_by(TemplateVersion.template_id, TemplateVersion.language).subquery()
+    return stmt.join(
+        latest,
+        (TemplateVersion.template_id == latest.c.template_id)
+        & (TemplateVersion.language == latest.c.language)
+        & (TemplateVersion.version_number == latest.c.version_number)
+    )
+
+def list_latest_versions(session: Session) -> List[TemplateVersion]:
+    """Latest version of every (template, language) pair, with its template, in one query."""
+    stmt = _join_latest(select(TemplateVersion).join(Template)).options(contains_eager(TemplateVersion.template))
+    return session.exec(stmt).all()
+
+def invalidate_template_count() -> None:
+    global _template_count
+    _template_count = None
+
+def count_templates(session: Session) -> int:
+    global _template_count
+    now = time.monotonic()
+    if _template_count is not None and _template_count[1] > now:
+        return _template_count[0]
+    total = session.exec(select(func.count()).select_from(Template)).one()
+    if TEMPLATE_COUNT_CACHE_TTL > 0:
+        _template_count = (total, now + TEMPLATE_COUNT_CACHE_TTL)
+    return total
 
-def list_templates(session: Session, limit: int = 20, page: int = 1) -> Tuple[List[Template], int]:
-    offset = (page - 1) * limit
-    total = session.exec(select(Template)).all()
-    items = session.exec(select(Template).offset(offset).limit(limit)).all()
-    return items, len(total)
+def list_templates(session: Session, limit: int = 20, page: int = 1, after_id: Optional[int] = None) -> Tuple[List[Template], int]:
+    stmt = select(Template).order_by(Template.id).limit(limit)
+    if after_id is not None:
+        # keyset pagination: seek past the last id instead of scanning OFFSET rows
+        stmt = stmt.where(Template.id > after_id)
+    else:
+        stmt = stmt.offset((page - 1) * limit)
+    items = session.exec(stmt).all()
+    return items, count_templates(session)
@@ -1,7 +1,10 @@
 import os
-from fastapi import FastAPI
-from app.database import init_db
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
+from app.database import init_db, dispose_engines
 from app.routes import router as templates_router
+from app.metrics import render_latest
+from app.warmup import start_warm_up, warmup_state
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
@@ -24,7 +27,20 @@ app.include_router(templates_router)
 @app.on_event("startup")
 def on_startup():
     init_db()
+    # runs in the background so /health can report warming_up meanwhile
+    start_warm_up()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await dispose_engines()
 
 @app.get("/health")
 def health():
+    if not warmup_state.ready.is_set():
+        return JSONResponse(status_code=503, content={"success": False, "message": "warming_up"})
     return {"success": True, "message": "ok"}
+
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,39 @@
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from app.cache import compiled_templates, resolved_versions
+
+_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+RESOLVE_LATENCY = Histogram(
+    "template_resolve_seconds", "Time to resolve a template version",
+    ["source"], buckets=_LATENCY_BUCKETS,
+)
+RENDER_LATENCY = Histogram(
+    "template_render_seconds", "Time to render one subject/body pair",
+    ["endpoint"], buckets=_LATENCY_BUCKETS,
+)
+
+
+class CacheCollector:
+    """Reads the cache counters at scrape time instead of updating metrics on every lookup."""
+
+    def collect(self):
+        caches = (("compiled_templates", compiled_templates.stats()),
+                  ("resolved_versions", resolved_versions.stats()))
+        for counter in ("hits", "misses", "evictions"):
+            family = CounterMetricFamily(f"template_cache_{counter}", f"Template cache {counter}", labels=["cache"])
+            for name, stats in caches:
+                if counter in stats:
+                    family.add_metric([name], stats[counter])
+            yield family
+        entries = GaugeMetricFamily("template_cache_entries", "Entries held in a template cache", labels=["cache"])
+        for name, stats in caches:
+            entries.add_metric([name], stats["entries"])
+        yield entries
+
+
+REGISTRY.register(CacheCollector())
+
+
+def render_latest():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,10 +1,16 @@
 from datetime import datetime
 from typing import Optional, List
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 
 class Template(SQLModel, table=True):
+    # one template per code; also what lets concurrent creators of a new code detect each other
+    __table_args__ = (
+        Index("ux_template_code", "code", unique=True),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    code: str = Field(index=True, nullable=False)
+    code: str = Field(nullable=False)
     template_type: str = Field(default="email")  # email|push_web|push_mobile
     default_language: str = Field(default="en")
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -14,6 +20,11 @@ class Template(SQLModel, table=True):
 
 
 class TemplateVersion(SQLModel, table=True):
+    # one row per (template, language, version); also serves "latest version" lookups
+    __table_args__ = (
+        Index("ux_templateversion_template_language_version", "template_id", "language", "version_number", unique=True),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     template_id: int = Field(foreign_key="template.id")
     language: str = Field(default="en", index=True)
@@ -1,47 +1,208 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import json
+import os
+import time
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
-from .database import get_session
+from sqlmodel import Session as SQLModelSession
+from starlette.concurrency import run_in_threadpool
+from .database import engine, get_session, get_async_session, DB_ASYNC
 from app.crud import (
-    create_template_version, get_template_version, list_templates, get_template_by_code
+    create_template_version, get_template_version, list_templates, get_template_by_code,
+    aget_template_version, bulk_create_template_versions, iter_template_versions
 )
 from app.schemas import (
     TemplateVersionCreate, TemplateVersionOut, RenderRequest,
-    RenderResponse, ListResponse, PaginationMeta, TemplateOut
+    RenderResponse, ListResponse, PaginationMeta, TemplateOut,
+    RenderBatchRequest, RenderBatchItem
 )
-from app.utils import render_subject_and_body
+from app.utils import render_version, get_compiled_version, render_compiled, encode_cursor, decode_cursor
+from app.cache import compiled_templates, resolved_versions
+from app.metrics import RENDER_LATENCY
 
 router = APIRouter(prefix="/api/v1/templates", tags=["templates"])
 
+BULK_IMPORT_MAX_ITEMS = int(os.getenv("BULK_IMPORT_MAX_ITEMS", "5000"))
+
 @router.post("/", response_model=TemplateVersionOut)
 def create_template_version_endpoint(payload: TemplateVersionCreate, session: Session = Depends(get_session)):
     tv = create_template_version(session, payload)
     return tv
 
 @router.get("/", response_model=ListResponse)
-def list_templates_endpoint(limit: int = Query(20, ge=1, le=100), page: int = Query(1, ge=1), session: Session = Depends(get_session)):
-    items, total = list_templates(session, limit=limit, page=page)
+def list_templates_endpoint(limit: int = Query(20, ge=1, le=100), page: int = Query(1, ge=1), cursor: str | None = None, session: Session = Depends(get_session)):
+    after_id = None
+    if cursor:
+        try:
+            after_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="invalid_cursor")
+    if after_id is not None:
+        # fetch one extra row to learn whether another page follows
+        items, total = list_templates(session, limit=limit + 1, after_id=after_id)
+        has_next = len(items) > limit
+        items = items[:limit]
+        has_previous = True
+    else:
+        items, total = list_templates(session, limit=limit, page=page)
+        has_next = page < (total + limit - 1) // limit
+        has_previous = page > 1
     total_pages = (total + limit - 1) // limit if total else 0
     meta = PaginationMeta(
         total=total,
         limit=limit,
         page=page,
         total_pages=total_pages,
-        has_next=page < total_pages,
-        has_previous=page > 1
+        has_next=has_next,
+        has_previous=has_previous,
+        next_cursor=encode_cursor(items[-1].id) if has_next and items else None
     )
     return ListResponse(success=True, data=[TemplateOut.from_orm(i) for i in items], message="ok", meta=meta)
 
-@router.get("/get", response_model=TemplateVersionOut)
-def get_template_version_endpoint(template_code: str, language: str = "en", version_number: int | None = None, session: Session = Depends(get_session)):
-    tv = get_template_version(session, template_code, language, version_number)
+def _render_response(tv, req: RenderRequest) -> RenderResponse:
     if not tv:
         raise HTTPException(status_code=404, detail="template_not_found")
-    return tv
+    with RENDER_LATENCY.labels(endpoint="render").time():
+        subject, body = render_version(tv, req.variables or {})
+    return RenderResponse(subject=subject, body=body)
+
+if DB_ASYNC:
+    @router.get("/get", response_model=TemplateVersionOut)
+    async def get_template_version_endpoint(template_code: str, language: str = "en", version_number: int | None = None, session=Depends(get_async_session)):
+        tv = await aget_template_version(session, template_code, language, version_number)
+        if not tv:
+            raise HTTPException(status_code=404, detail="template_not_found")
+        return tv
+
+    @router.post("/render", response_model=RenderResponse)
+    async def render_endpoint(req: RenderRequest, session=Depends(get_async_session)):
+        tv = await aget_template_version(session, req.template_code, req.language or "en", req.version_number)
+        return _render_response(tv, req)
+else:
+    @router.get("/get", response_model=TemplateVersionOut)
+    def get_template_version_endpoint(template_code: str, language: str = "en", version_number: int | None = None, session: Session = Depends(get_session)):
+        tv = get_template_version(session, template_code, language, version_number)
+        if not tv:
+            raise HTTPException(status_code=404, detail="template_not_found")
+        return tv
 
-@router.post("/render", response_model=RenderResponse)
-def render_endpoint(req: RenderRequest, session: Session = Depends(get_session)):
-    tv = get_template_version(session, req.template_code, req.language or "en", req.version_number)
+    @router.post("/render", response_model=RenderResponse)
+    def render_endpoint(req: RenderRequest, session: Session = Depends(get_session)):
+        tv = get_template_version(session, req.template_code, req.language or "en", req.version_number)
+        return _render_response(tv, req)
+
+RENDER_BATCH_CHUNK = 100
+
+def _render_batch_lines(compiled, items):
+    chunk = []
+    observe = RENDER_LATENCY.labels(endpoint="render_batch").observe
+    for index, variables in enumerate(items):
+        try:
+            started = time.perf_counter()
+            subject, body = render_compiled(compiled, variables or {})
+            observe(time.perf_counter() - started)
+            item = RenderBatchItem(index=index, success=True, subject=subject, body=body)
+        except Exception as exc:
+            # one bad variable set must not fail the rest of the campaign
+            item = RenderBatchItem(index=index, success=False, error=str(exc))
+        chunk.append(json.dumps(item.dict()))
+        if len(chunk) >= RENDER_BATCH_CHUNK:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+def _render_batch_response(tv, req: RenderBatchRequest) -> StreamingResponse:
+    """
+    Render one template for many variable sets. Responds with NDJSON, one
+    RenderBatchItem per line in request order, streamed as it is rendered.
+    """
     if not tv:
         raise HTTPException(status_code=404, detail="template_not_found")
-    subject, body = render_subject_and_body(tv.subject, tv.body, req.variables or {})
-    return RenderResponse(subject=subject, body=body)
+    compiled = get_compiled_version(tv)
+    return StreamingResponse(_render_batch_lines(compiled, req.items), media_type="application/x-ndjson")
+
+if DB_ASYNC:
+    @router.post("/render/batch")
+    async def render_batch_endpoint(req: RenderBatchRequest, session=Depends(get_async_session)):
+        tv = await aget_template_version(session, req.template_code, req.language or "en", req.version_number)
+        return _render_batch_response(tv, req)
+else:
+    @router.post("/render/batch")
+    def render_batch_endpoint(req: RenderBatchRequest, session: Session = Depends(get_session)):
+        tv = get_template_version(session, req.template_code, req.language or "en", req.version_number)
+        return _render_batch_response(tv, req)
+
+def _parse_bulk_body(raw: bytes) -> List[TemplateVersionCreate]:
+    try:
+        # UnicodeDecodeError is a ValueError too
+        text = raw.decode()
+        if text.lstrip().startswith("["):
+            items = json.loads(text)
+        else:
+            # NDJSON: one TemplateVersionCreate per non-empty line
+            items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid_json")
+    if not items:
+        raise HTTPException(status_code=400, detail="empty_payload")
+    if len(items) > BULK_IMPORT_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail="too_many_items")
+    payloads = []
+    for index, item in enumerate(items):
+        try:
+            payloads.append(TemplateVersionCreate.parse_obj(item))
+        except ValidationError as exc:
+            raise HTTPException(status_code=422, detail={"index": index, "errors": exc.errors()})
+    return payloads
+
+@router.post("/bulk", response_model=ListResponse)
+async def bulk_import_endpoint(request: Request, session: Session = Depends(get_session)):
+    """
+    Create many versions at once from a JSON array or NDJSON of TemplateVersionCreate.
+    All rows are inserted in one transaction; items for the same template and
+    language get consecutive version numbers in request order.
+    """
+    payloads = _parse_bulk_body(await request.body())
+    versions = await run_in_threadpool(bulk_create_template_versions, session, payloads)
+    return ListResponse(
+        success=True,
+        data=[TemplateVersionOut.from_orm(tv) for tv in versions],
+        message=f"imported {len(versions)} versions"
+    )
+
+EXPORT_CHUNK = 100
+
+def _export_lines(language: str | None, latest_only: bool):
+    # the request-scoped session is closed once the endpoint returns, so the stream owns its own
+    with SQLModelSession(engine) as session:
+        chunk = []
+        for tv, tpl in iter_template_versions(session, language, latest_only):
+            chunk.append(json.dumps({
+                "template_code": tpl.code,
+                "template_type": tpl.template_type,
+                "language": tv.language,
+                "version_number": tv.version_number,
+                "subject": tv.subject,
+                "body": tv.body,
+                "changelog": tv.changelog,
+            }))
+            if len(chunk) >= EXPORT_CHUNK:
+                yield "\n".join(chunk) + "\n"
+                chunk = []
+        if chunk:
+            yield "\n".join(chunk) + "\n"
+
+@router.get("/export")
+def export_endpoint(language: str | None = None, latest_only: bool = False):
+    """Stream versions as NDJSON in the /bulk import format (version_number is informational)."""
+    return StreamingResponse(_export_lines(language, latest_only), media_type="application/x-ndjson")
+
+@router.get("/cache/stats")
+def cache_stats_endpoint():
+    return {"success": True, "message": "ok", "data": {
+        "compiled_templates": compiled_templates.stats(),
+        "resolved_versions": resolved_versions.stats(),
+    }}
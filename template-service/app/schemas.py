@@ -57,6 +57,20 @@ class RenderResponse(BaseModel):
     subject: Optional[str]
     body: str
 
+class RenderBatchRequest(BaseModel):
+    template_code: str
+    language: Optional[str] = "en"
+    version_number: Optional[int] = None
+    items: List[Dict[str, Any]]               # one variables dict per recipient
+
+class RenderBatchItem(BaseModel):
+    # one NDJSON line of the /render/batch response, in request order
+    index: int
+    success: bool
+    subject: Optional[str] = None
+    body: Optional[str] = None
+    error: Optional[str] = None
+
 class PaginationMeta(BaseModel):
     total: int
     limit: int
@@ -64,6 +78,7 @@ class PaginationMeta(BaseModel):
     total_pages: int
     has_next: bool
     has_previous: bool
+    next_cursor: Optional[str] = None         # pass back as ?cursor= for keyset pagination
 
 class ListResponse(BaseModel):
     success: bool
@@ -1,23 +1,120 @@
-from jinja2 import Template as JinjaTemplate
-from typing import Dict, Tuple, Any
+from jinja2 import Template as JinjaTemplate, FileSystemBytecodeCache
+from jinja2.sandbox import SandboxedEnvironment
+from typing import Dict, Tuple, Any, Optional, NamedTuple
+import base64
 import json
+import os
+from app.cache import compiled_templates
 
-def render_subject_and_body(subject_template: str | None, body_template: str, variables: Dict[str, Any]) -> Tuple[str | None, str]:
+# templates are user-supplied, so they render in a sandbox; only email bodies are HTML-escaped
+_text_env = SandboxedEnvironment(autoescape=False)
+_html_env = SandboxedEnvironment(autoescape=True)
+
+# optional directory where compiled template code persists across restarts (e.g. a volume);
+# it is loaded as code, so only this service may write to it
+BYTECODE_CACHE_DIR = os.getenv("TEMPLATE_BYTECODE_CACHE_DIR", "")
+_bytecode_cache = None
+if BYTECODE_CACHE_DIR:
+    os.makedirs(BYTECODE_CACHE_DIR, exist_ok=True)
+    _bytecode_cache = FileSystemBytecodeCache(BYTECODE_CACHE_DIR)
+
+def _from_string(env: SandboxedEnvironment, source: str) -> JinjaTemplate:
+    """env.from_string, reusing persisted bytecode when TEMPLATE_BYTECODE_CACHE_DIR is set."""
+    if _bytecode_cache is None:
+        return env.from_string(source)
+    # keyed on the source itself (and checked against it), so an edited template never loads stale code
+    bucket = _bytecode_cache.get_bucket(env, f"autoescape={env.autoescape}:{source}", None, source)
+    if bucket.code is None:
+        bucket.code = env.compile(source)
+        _bytecode_cache.set_bucket(bucket)
+    return env.template_class.from_code(env, bucket.code, env.make_globals(None))
+
+PUSH_TEMPLATE_TYPES = ("push_web", "push_mobile")
+
+# how a compiled body is rendered, decided once at compile time from Template.template_type
+BODY_HTML = "html"            # email: autoescaped HTML/text
+BODY_JSON = "json"            # push: parsed JSON structure with templated leaf strings
+BODY_JSON_TEXT = "json_text"  # push whose source isn't valid JSON until rendered (e.g. {{ n }} numbers)
+
+class CompiledVersion(NamedTuple):
+    subject: Optional[JinjaTemplate]
+    body: Any
+    body_kind: str
+
+def _compile_json(node: Any) -> Any:
+    if isinstance(node, str):
+        # plain strings stay as-is so rendering them is free
+        return _from_string(_text_env, node) if ("{{" in node or "{%" in node) else node
+    if isinstance(node, dict):
+        return {key: _compile_json(value) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_compile_json(value) for value in node]
+    return node
+
+def _render_json(node: Any, variables: Dict[str, Any]) -> Any:
+    if isinstance(node, JinjaTemplate):
+        return node.render(variables)
+    if isinstance(node, dict):
+        return {key: _render_json(value, variables) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_render_json(value, variables) for value in node]
+    return node
+
+def compile_subject_and_body(subject_template: str | None, body_template: str, template_type: str = "email") -> CompiledVersion:
+    subj_t = _from_string(_text_env, subject_template) if subject_template else None
+    if template_type in PUSH_TEMPLATE_TYPES:
+        try:
+            structure = json.loads(body_template)
+        except ValueError:
+            return CompiledVersion(subj_t, _from_string(_text_env, body_template), BODY_JSON_TEXT)
+        return CompiledVersion(subj_t, _compile_json(structure), BODY_JSON)
+    return CompiledVersion(subj_t, _from_string(_html_env, body_template), BODY_HTML)
+
+def render_compiled(compiled: CompiledVersion, variables: Dict[str, Any]) -> Tuple[str | None, str]:
+    variables = variables or {}
     # Render subject if exists
-    subj = None
-    if subject_template:
-        subj_t = JinjaTemplate(subject_template)
-        subj = subj_t.render(**(variables or {}))
-    # Body might be HTML (email) or JSON string (push templates JSON)
-    # If body_template looks like JSON we treat it as JSON and render templates inside string
-    body = body_template
-    body = JinjaTemplate(body_template).render(**(variables or {}))
-    # Try to parse JSON for push templates
-    try:
-        parsed = json.loads(body)
-        # if JSON, return serialized JSON string (consumers can parse)
-        body = json.dumps(parsed)
-    except Exception:
-        # not JSON — fine (email HTML)
-        pass
+    subj = compiled.subject.render(variables) if compiled.subject is not None else None
+    if compiled.body_kind == BODY_JSON:
+        # only the leaf strings are rendered; serialize once, no reparse
+        return subj, json.dumps(_render_json(compiled.body, variables))
+    body = compiled.body.render(variables)
+    if compiled.body_kind == BODY_JSON_TEXT:
+        # JSON only exists after rendering: normalize it if it parses
+        try:
+            body = json.dumps(json.loads(body))
+        except ValueError:
+            pass
     return subj, body
+
+def render_subject_and_body(subject_template: str | None, body_template: str, variables: Dict[str, Any], template_type: str = "email") -> Tuple[str | None, str]:
+    return render_compiled(compile_subject_and_body(subject_template, body_template, template_type), variables)
+
+def get_compiled_version(tv) -> CompiledVersion:
+    # versions are immutable once published, so (template_id, language, version_number) is a stable key
+    key = (tv.template_id, tv.language, tv.version_number)
+    compiled = compiled_templates.get(key)
+    if compiled is None:
+        # crud loads the parent template alongside the version, so this is not a lazy load
+        template_type = tv.template.template_type if tv.template else "email"
+        compiled = compile_into_cache(key, tv.subject, tv.body, template_type)
+    return compiled
+
+def compile_into_cache(key: Tuple[int, str, int], subject_template: str | None, body_template: str, template_type: str = "email") -> CompiledVersion:
+    compiled = compile_subject_and_body(subject_template, body_template, template_type)
+    size = len((subject_template or "").encode()) + len(body_template.encode())
+    compiled_templates.put(key, compiled, size)
+    return compiled
+
+def render_version(tv, variables: Dict[str, Any]) -> Tuple[str | None, str]:
+    return render_compiled(get_compiled_version(tv), variables)
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    """Return the last seen id encoded in an opaque list cursor; raises ValueError if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded.encode()))["id"])
+    except Exception as exc:
+        raise ValueError("invalid cursor") from exc
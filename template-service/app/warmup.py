@@ -0,0 +1,47 @@
+import os
+import threading
+import time
+from sqlmodel import Session
+from app.database import engine
+from app.cache import resolved_versions
+from app.crud import list_latest_versions
+from app.utils import BYTECODE_CACHE_DIR, get_compiled_version
+
+# bulk-load and precompile the latest version of every template/language on startup
+TEMPLATE_PRELOAD = os.getenv("TEMPLATE_PRELOAD", "false").lower() in ("1", "true", "yes")
+
+
+class WarmupState:
+    def __init__(self):
+        self.ready = threading.Event()
+        self.loaded = 0
+        self.error = None
+
+warmup_state = WarmupState()
+
+
+def warm_up() -> None:
+    started = time.monotonic()
+    try:
+        with Session(engine) as session:
+            versions = list_latest_versions(session)
+        for tv in versions:
+            resolved_versions.put((tv.template.code, tv.language, None), tv)
+            # loads persisted bytecode instead of compiling when TEMPLATE_BYTECODE_CACHE_DIR has it
+            get_compiled_version(tv)
+        warmup_state.loaded = len(versions)
+        print(f"[warmup] {len(versions)} versions ready "
+              f"(bytecode cache {BYTECODE_CACHE_DIR or 'off'}) in {time.monotonic() - started:.2f}s")
+    except Exception as e:
+        # a failed warm-up only means a cold cache; serve traffic anyway
+        warmup_state.error = repr(e)
+        print("[warmup] failed:", e)
+    finally:
+        warmup_state.ready.set()
+
+
+def start_warm_up() -> None:
+    if not TEMPLATE_PRELOAD:
+        warmup_state.ready.set()
+        return
+    threading.Thread(target=warm_up, name="template-warmup", daemon=True).start()
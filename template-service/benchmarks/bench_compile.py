@@ -0,0 +1,67 @@
+"""
+Per-render cost of the email (HTML) and push (JSON) paths in app.utils.
+
+Compares the original approach (new jinja2.Template per call, then a
+json.loads/json.dumps attempt on every body) with precompiled versions
+rendered through render_compiled.
+
+    python benchmarks/bench_compile.py --iterations 20000
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jinja2 import Template as JinjaTemplate  # noqa: E402
+
+from app.utils import compile_subject_and_body, render_compiled  # noqa: E402
+
+EMAIL_SUBJECT = "Welcome {{ name }}"
+EMAIL_BODY = (
+    "<html><body><h1>Hi {{ name }}</h1><p>Welcome to {{ app_name }}. "
+    "Your code is <b>{{ code }}</b>.</p>{% for item in items %}<li>{{ item }}</li>{% endfor %}</body></html>"
+)
+PUSH_BODY = json.dumps({
+    "title": "Hi {{ name }}",
+    "body": "Your order {{ order_id }} has shipped",
+    "data": {"order_id": "{{ order_id }}", "deep_link": "app://orders/{{ order_id }}", "badge": 1},
+    "actions": [{"id": "open", "label": "Open"}, {"id": "track", "label": "Track {{ order_id }}"}],
+})
+VARIABLES = {"name": "Ada", "app_name": "Notify", "code": "123456", "items": ["a", "b", "c"], "order_id": "A-42"}
+
+
+def legacy_render(subject_template, body_template, variables):
+    subj = JinjaTemplate(subject_template).render(**variables) if subject_template else None
+    body = JinjaTemplate(body_template).render(**variables)
+    try:
+        body = json.dumps(json.loads(body))
+    except Exception:
+        pass
+    return subj, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10000)
+    args = parser.parse_args()
+
+    email = compile_subject_and_body(EMAIL_SUBJECT, EMAIL_BODY, "email")
+    push = compile_subject_and_body(None, PUSH_BODY, "push_mobile")
+    cases = (
+        ("email legacy", lambda: legacy_render(EMAIL_SUBJECT, EMAIL_BODY, VARIABLES)),
+        ("email compiled", lambda: render_compiled(email, VARIABLES)),
+        ("push legacy", lambda: legacy_render(None, PUSH_BODY, VARIABLES)),
+        ("push compiled", lambda: render_compiled(push, VARIABLES)),
+    )
+    print(f"{'case':<16} {'us/render':>10} {'renders/s':>12}")
+    for name, fn in cases:
+        elapsed = min(timeit.repeat(fn, number=args.iterations, repeat=3))
+        per_call = elapsed / args.iterations
+        print(f"{name:<16} {per_call * 1e6:>10.2f} {1 / per_call:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()